@@ -0,0 +1,114 @@
+import threading
+import numpy as np
+
+# Quantities below this are treated as zero when allocating (float rounding).
+EPSILON = 1e-9
+
+
+def clear_auction(bid_prices, bid_quantities, ask_prices, ask_quantities):
+    """
+    Clear one time slot as a uniform-price double auction.
+    Every candidate price (the distinct order prices) is evaluated at once: the supply curve
+    is the cumulative ask quantity priced at or below it and the demand curve the cumulative
+    bid quantity priced at or above it, both read off sorted arrays with searchsorted. The
+    clearing price maximises the traded volume; ties go to the smallest surplus/shortage,
+    then to the middle of the remaining price range.
+
+    Orders priced strictly better than the marginal price level are filled in full and the
+    marginal level is pro-rated. Returns a dict with 'price' (None if nothing trades),
+    'volume', and 'bid_fills'/'ask_fills' aligned with the input arrays.
+    """
+    bid_prices = np.asarray(bid_prices, dtype=np.float64)
+    bid_quantities = np.asarray(bid_quantities, dtype=np.float64)
+    ask_prices = np.asarray(ask_prices, dtype=np.float64)
+    ask_quantities = np.asarray(ask_quantities, dtype=np.float64)
+    result = {'price': None, 'volume': 0.0,
+              'bid_fills': np.zeros(len(bid_prices)), 'ask_fills': np.zeros(len(ask_prices))}
+    if not len(bid_prices) or not len(ask_prices):
+        return result
+
+    # Supply curve: asks sorted by price, cumulative quantity.
+    ask_order = np.argsort(ask_prices, kind='stable')
+    ask_sorted = ask_prices[ask_order]
+    ask_cum = np.concatenate(([0.0], np.cumsum(ask_quantities[ask_order])))
+    # Demand curve: bids sorted by price, quantity at or above a price = total - cumulative below it.
+    bid_order = np.argsort(bid_prices, kind='stable')
+    bid_sorted = bid_prices[bid_order]
+    bid_cum = np.concatenate(([0.0], np.cumsum(bid_quantities[bid_order])))
+
+    candidates = np.unique(np.concatenate((bid_prices, ask_prices)))
+    supply = ask_cum[np.searchsorted(ask_sorted, candidates, side='right')]
+    demand = bid_cum[-1] - bid_cum[np.searchsorted(bid_sorted, candidates, side='left')]
+    volume = np.minimum(supply, demand)
+    best_volume = volume.max()
+    if best_volume <= EPSILON:
+        return result
+    best = volume >= best_volume - EPSILON
+    imbalance = np.abs(supply - demand)
+    best &= imbalance <= imbalance[best].min() + EPSILON
+    best_prices = candidates[best]
+    price = (best_prices[0] + best_prices[-1]) / 2
+
+    result['price'] = float(price)
+    result['volume'] = float(best_volume)
+    result['bid_fills'] = allocate(bid_prices, bid_quantities, bid_prices >= price, -bid_prices, best_volume)
+    result['ask_fills'] = allocate(ask_prices, ask_quantities, ask_prices <= price, ask_prices, best_volume)
+    return result
+
+
+def allocate(prices, quantities, eligible, priority, volume):
+    """
+    Split volume over the eligible orders of one side: best priority (lowest value) levels
+    are filled in full, the marginal price level pro rata to quantity, the rest get nothing.
+    """
+    fills = np.zeros(len(prices))
+    idx = np.flatnonzero(eligible)
+    if not len(idx):
+        return fills
+    idx = idx[np.argsort(priority[idx], kind='stable')]
+    cum = np.cumsum(quantities[idx])
+    # The first order whose cumulative quantity reaches the volume sets the marginal level.
+    k = min(int(np.searchsorted(cum, volume - EPSILON, side='left')), len(idx) - 1)
+    marginal = prices[idx[k]]
+    ahead = idx[:k]
+    better = ahead[prices[ahead] != marginal]
+    fills[better] = quantities[better]
+    level = idx[prices[idx] == marginal]
+    remaining = volume - fills[better].sum()
+    level_total = quantities[level].sum()
+    if level_total > 0 and remaining > 0:
+        fills[level] = quantities[level] * min(1.0, remaining / level_total)
+    return fills
+
+
+class DayAheadBook:
+    """
+    Day-ahead orders collected until gate closure, per delivery slot and side.
+    A slot is the (start, end) pair of seconds from the order's time window. Orders are
+    kept as parallel lists and only turned into arrays when the slot is cleared.
+    """
+    def __init__(self):
+        self.slots = {}     # slot -> {'bids': {...}, 'asks': {...}}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(side['ids']) for sides in self.slots.values() for side in sides.values())
+
+    def add(self, side, slot, order_id, username, price, quantity):
+        """Add a 'bids' or 'asks' order for the slot."""
+        with self.lock:
+            sides = self.slots.get(slot)
+            if sides is None:
+                sides = self.slots[slot] = {name: {'ids': [], 'users': [], 'prices': [], 'quantities': []}
+                                            for name in ('bids', 'asks')}
+            orders = sides[side]
+            orders['ids'].append(order_id)
+            orders['users'].append(username)
+            orders['prices'].append(price)
+            orders['quantities'].append(quantity)
+
+    def close(self):
+        """Gate closure: hand over every collected slot and start an empty book."""
+        with self.lock:
+            slots, self.slots = self.slots, {}
+        return slots
@@ -0,0 +1,42 @@
+"""
+Day-ahead call auction clearing time for one delivery slot.
+
+Usage: python benchmarks/bench_auction.py [n_orders]   (default: 100000, split evenly into bids and asks)
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from auction import clear_auction
+
+
+def run(n_orders, repeats=5):
+    rng = np.random.default_rng(0)
+    n_bids = n_orders // 2
+    n_asks = n_orders - n_bids
+    # Prices in 0.01 steps, so many orders share a price level and get pro-rated.
+    bid_prices = np.round(rng.normal(8.0, 2.0, n_bids), 2)
+    ask_prices = np.round(rng.normal(7.0, 2.0, n_asks), 2)
+    bid_quantities = rng.uniform(0.5, 20.0, n_bids)
+    ask_quantities = rng.uniform(0.5, 20.0, n_asks)
+    # The server keeps orders in lists until gate closure; include the conversion.
+    orders = [list(a) for a in (bid_prices, bid_quantities, ask_prices, ask_quantities)]
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = clear_auction(*orders)
+        timings.append(time.perf_counter() - start)
+
+    assert abs(result['bid_fills'].sum() - result['volume']) < 1e-6 * result['volume']
+    assert abs(result['ask_fills'].sum() - result['volume']) < 1e-6 * result['volume']
+    print(f"{n_orders} orders in one slot ({n_bids} bids, {n_asks} asks)")
+    print(f"  clearing price {result['price']:.2f}, volume {result['volume']:,.1f} kWh")
+    print(f"  clear time: best {min(timings) * 1000:.1f} ms, median {sorted(timings)[len(timings) // 2] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,151 @@
+"""
+Auto mode matching: the nested buyer x seller scan run after every AUTO_SELLER/AUTO_BUYER
+message (before) versus the price-time priority OrderBook (after).
+
+Before timing anything, the fills of both are checked against the expected fills of a set
+of small hand-written books (several buyers, equal prices, leftover and exhausted seller
+energy, prices that do not cross), and against each other on two generated books with
+many fills: one resting seller that buyers arrive against, and buyers arriving one at a
+time with sellers arriving until one fills them. In all of these at most one resting order
+can match the new one, so both implementations must fill identically. (With several
+crossing orders resting, the order book fills by price first where the scan went by
+arrival order, so fills are not compared there.)
+
+Usage: python benchmarks/bench_auto_match.py [n_orders]   (default: 2000)
+"""
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from orderbook import OrderBook
+
+
+def legacy_attempt_auto_match(auto_buyers, auto_sellers):
+    """Server.attempt_auto_match as it was before the order book, minus persistence/notifications."""
+    fills = []
+    for buyer in auto_buyers[:]:
+        for seller in auto_sellers[:]:
+            if seller['energy_amount'] >= buyer['needed_energy'] and seller['min_price'] <= buyer['max_price']:
+                transaction_energy = buyer['needed_energy']
+                seller['energy_amount'] -= transaction_energy
+                if seller['energy_amount'] <= 0:
+                    auto_sellers.remove(seller)
+                auto_buyers.remove(buyer)
+                fills.append((buyer['buyer_id'], seller['seller_id'], transaction_energy, seller['min_price']))
+                break
+    return fills
+
+
+def legacy_fills(orders):
+    auto_buyers, auto_sellers, fills = [], [], []
+    for order in orders:
+        (auto_sellers if 'seller_id' in order else auto_buyers).append(dict(order))
+        fills.extend(legacy_attempt_auto_match(auto_buyers, auto_sellers))
+    return fills
+
+
+def book_fills(orders):
+    book, fills = OrderBook(), []
+    for order in orders:
+        order = dict(order)
+        new = book.add_seller(order) if 'seller_id' in order else book.add_buyer(order)
+        fills.extend((f['buyer']['buyer_id'], f['seller']['seller_id'], f['energy_amount'], f['price']) for f in new)
+    return fills
+
+
+def S(seller_id, energy_amount, min_price):
+    return {'seller_id': seller_id, 'energy_amount': energy_amount, 'min_price': min_price}
+
+
+def B(buyer_id, needed_energy, max_price):
+    return {'buyer_id': buyer_id, 'needed_energy': needed_energy, 'max_price': max_price}
+
+
+# (name, orders in arrival order, expected fills as (buyer_id, seller_id, energy, price)).
+CASES = [
+    ("buyer meets a seller", [S('s1', 10, 5), B('b1', 5, 6)], [('b1', 's1', 5, 5)]),
+    ("seller meets a resting buyer", [B('b1', 5, 6), S('s1', 10, 5)], [('b1', 's1', 5, 5)]),
+    ("prices do not cross", [S('s1', 10, 7), B('b1', 5, 6)], []),
+    ("crosses once a dearer buyer arrives", [S('s1', 10, 7), B('b1', 5, 6), B('b2', 5, 7)],
+     [('b2', 's1', 5, 7)]),
+    ("seller too small", [S('s1', 3, 5), B('b1', 5, 6)], []),
+    ("several buyers, seller energy left over",
+     [S('s1', 10, 5), B('b1', 3, 6), B('b2', 4, 5), B('b3', 5, 7)],
+     [('b1', 's1', 3, 5), ('b2', 's1', 4, 5)]),
+    ("seller exhausted exactly",
+     [S('s1', 6, 5), B('b1', 3, 5), B('b2', 3, 5), B('b3', 1, 9)],
+     [('b1', 's1', 3, 5), ('b2', 's1', 3, 5)]),
+    ("equal buyer prices fill in arrival order",
+     [B('b1', 4, 6), B('b2', 4, 6), B('b3', 4, 6), S('s1', 10, 5)],
+     [('b1', 's1', 4, 5), ('b2', 's1', 4, 5)]),
+    ("equal seller prices, first seller with enough energy",
+     [S('s1', 3, 5), S('s2', 6, 5), S('s3', 6, 5), B('b1', 5, 6)],
+     [('b1', 's2', 5, 5)]),
+    ("resting buyer waits for a large enough seller",
+     [B('b1', 8, 6), S('s1', 5, 5), S('s2', 9, 6), B('b2', 4, 6)],
+     [('b1', 's2', 8, 6), ('b2', 's1', 4, 5)]),
+]
+
+
+def one_seller(n_orders, rng):
+    """One large seller, then n buyers of random size and price."""
+    orders = [S('s0', 10 * n_orders, 5)]
+    orders += [B(f"b{i}", rng.randint(1, 20), rng.randint(1, 10)) for i in range(n_orders)]
+    return orders
+
+
+def one_buyer_at_a_time(n_orders, rng):
+    """
+    Buyers (max price 5) arriving one at a time, each followed by sellers until one fills
+    it exactly. The sellers that do not fill it ask more than any buyer pays, so they rest
+    without ever matching and the buyer never has more than one candidate.
+    """
+    orders, i = [], 0
+    while len(orders) < n_orders:
+        needed = rng.randint(1, 20)
+        orders.append(B(f"b{len(orders)}", needed, 5))
+        for _ in range(rng.randint(0, 3)):
+            orders.append(S(f"s{i}", rng.randint(1, 20), rng.randint(6, 10)))
+            i += 1
+        orders.append(S(f"s{i}", needed, rng.randint(1, 5)))
+        i += 1
+    return orders
+
+
+def check():
+    """Assert both implementations produce the expected (or, when generated, the same) fills."""
+    for name, orders, expected in CASES:
+        assert legacy_fills(orders) == expected, f"legacy implementation: {name}"
+        assert book_fills(orders) == expected, f"order book: {name}"
+    rng = random.Random(1)
+    for _ in range(100):
+        for orders in (one_seller(50, rng), one_buyer_at_a_time(50, rng)):
+            assert legacy_fills(orders) == book_fills(orders), "order book fills disagree with the legacy implementation"
+    print(f"{len(CASES)} hand-written books and 200 generated books fill identically")
+
+
+def run(n_orders):
+    check()
+    rng = random.Random(1)
+    scenarios = {'one seller, arriving buyers': one_seller(n_orders, rng),
+                 'one buyer at a time, arriving sellers': one_buyer_at_a_time(n_orders, rng)}
+    print(f"{n_orders} arriving orders per scenario")
+    for name, orders in scenarios.items():
+        start = time.perf_counter()
+        before = legacy_fills(orders)
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        after = book_fills(orders)
+        book_s = time.perf_counter() - start
+
+        assert before == after, f"order book fills disagree with the legacy implementation ({name})"
+        print(f"  {name} ({len(after)} fills)")
+        print(f"    before (buyer x seller scan): {n_orders / legacy_s:12,.0f} orders/s")
+        print(f"    after  (order book):          {n_orders / book_s:12,.0f} orders/s")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,77 @@
+"""
+Per-user transaction history appends: pd.concat of a one-row DataFrame per trade (before)
+versus the chunked columnar Ledger (after).
+
+Usage: python benchmarks/bench_ledger.py [n_appends]   (default: 100000)
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ledger import Ledger
+
+COLUMNS = ['Transaction Time', 'Seller/Buyer', 'Energy Quantity (kWh)', 'Price per Unit',
+           'Amount of Duration', 'Date']
+
+
+def make_record(i):
+    now = datetime.now()
+    return {
+        'Transaction Time': str(now.strftime("%H:%M:%S")),
+        'Seller/Buyer': 'Seller' if i % 2 else 'Buyer',
+        'Energy Quantity (kWh)': 1.0 + i % 10,
+        'Price per Unit': 5.0 + i % 7,
+        'Amount of Duration': 3600,
+        'Date': now.strftime("%Y-%m-%d")
+    }
+
+
+def run_concat(records):
+    df = pd.DataFrame(columns=COLUMNS)
+    for record in records:
+        new_df = pd.DataFrame([record])
+        new_df['Transaction Time'] = new_df['Transaction Time'].astype(str)
+        df['Transaction Time'] = df['Transaction Time'].astype(str)
+        df = pd.concat([df, new_df], ignore_index=True)
+    return df
+
+
+def run_ledger(records):
+    ledger = Ledger(COLUMNS)
+    for record in records:
+        ledger.append(record)
+    return ledger
+
+
+def run(n_appends):
+    records = [make_record(i) for i in range(n_appends)]
+
+    # pd.concat is quadratic in the history length; time a prefix and report the rate.
+    n_concat = min(n_appends, 10000)
+    start = time.perf_counter()
+    before = run_concat(records[:n_concat])
+    concat_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ledger = run_ledger(records)
+    ledger_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    after = ledger.to_frame()
+    frame_s = time.perf_counter() - start
+
+    assert len(after) == n_appends
+    assert (before['Energy Quantity (kWh)'].astype(float).tolist()
+            == after['Energy Quantity (kWh)'][:n_concat].tolist())
+    print(f"{n_appends} transaction appends")
+    print(f"  before (pd.concat, first {n_concat} rows): {n_concat / concat_s:12,.0f} appends/s")
+    print(f"  after  (chunked ledger):          {n_appends / ledger_s:12,.0f} appends/s")
+    print(f"  one to_frame() for export:        {frame_s * 1000:12.1f} ms")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,64 @@
+"""
+Login latency with N users in the summary sheet.
+
+Compares the old Username column scan (boolean mask + DataFrame copy) with the
+username -> credential map that Server.authenticate_user now uses, and reports the
+full authenticate_user call (including the journal append; fsync and checkpoints
+disabled so only the in-memory path is measured).
+
+Usage: python benchmarks/bench_login.py [n_users ...]   (default: 10000 100000)
+"""
+import os
+import sys
+import tempfile
+import time
+import random
+import warnings
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from server import Server
+from storage import ExcelStorage
+
+warnings.simplefilter('ignore')
+
+
+def scan_login(database, username, password):
+    """The pre-index authenticate_user lookup."""
+    if username not in database['Username'].values:
+        return False
+    record = database[database['Username'] == username]
+    return not record.empty and str(record.iloc[0]['Password']) == str(password)
+
+
+def time_per_call(fn, usernames):
+    start = time.perf_counter()
+    for username in usernames:
+        fn(username)
+    return (time.perf_counter() - start) / len(usernames) * 1e6
+
+
+def run(n_users, lookups=2000):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'excell.xlsx')
+        server = Server(host='127.0.0.1', port=0, db_file=db_file,
+                        storage=ExcelStorage(db_file, fsync=False), compact_threshold=10**9)
+        server.database = pd.DataFrame({
+            'Username': [f'user{i}' for i in range(n_users)],
+            'Password': [str(i) for i in range(n_users)],
+        })
+        server.ensure_columns()
+        server.build_user_index()
+        usernames = [f'user{random.randrange(n_users)}' for _ in range(lookups)]
+        scan_us = time_per_call(lambda u: scan_login(server.database, u, u[4:]), usernames[:200])
+        index_us = time_per_call(lambda u: server.credentials.get(u) == u[4:], usernames)
+        auth_us = time_per_call(lambda u: server.authenticate_user(u, u[4:]), usernames)
+        server.shutdown(checkpoint=False)
+    print(f"{n_users:>8} users | column scan {scan_us:10.1f} us | index lookup {index_us:6.2f} us "
+          f"| authenticate_user {auth_us:8.1f} us")
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    for n in sizes:
+        run(n)
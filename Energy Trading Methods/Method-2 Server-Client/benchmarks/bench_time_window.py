@@ -0,0 +1,80 @@
+"""
+Time window matching throughput: strptime on every comparison (before) versus windows
+pre-parsed to seconds since midnight on ingest (after).
+
+Usage: python benchmarks/bench_time_window.py [n_pairs]   (default: 100000)
+"""
+import os
+import sys
+import random
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from timewindows import window_seconds, window_contains
+
+
+def legacy_is_time_window_match(seller_tw, buyer_tw, required_duration):
+    """Server.is_time_window_match as it was before windows were pre-parsed."""
+    dummy_date = datetime(1900, 1, 1)
+    try:
+        seller_start = datetime.strptime(seller_tw['start'], "%H:%M:%S").time()
+    except ValueError:
+        seller_start = datetime.strptime(seller_tw['start'], "%H:%M").time()
+    try:
+        seller_end = datetime.strptime(seller_tw['end'], "%H:%M:%S").time()
+    except ValueError:
+        seller_end = datetime.strptime(seller_tw['end'], "%H:%M").time()
+    seller_start_dt = datetime.combine(dummy_date, seller_start)
+    seller_end_dt = datetime.combine(dummy_date, seller_end)
+    try:
+        buyer_start = datetime.strptime(buyer_tw['start'], "%H:%M:%S").time()
+    except ValueError:
+        buyer_start = datetime.strptime(buyer_tw['start'], "%H:%M").time()
+    try:
+        buyer_end = datetime.strptime(buyer_tw['end'], "%H:%M:%S").time()
+    except ValueError:
+        buyer_end = datetime.strptime(buyer_tw['end'], "%H:%M").time()
+    buyer_start_dt = datetime.combine(dummy_date, buyer_start)
+    buyer_end_dt = datetime.combine(dummy_date, buyer_end)
+    if buyer_start_dt >= seller_start_dt and buyer_end_dt <= seller_end_dt:
+        if (buyer_end_dt - buyer_start_dt).total_seconds() >= required_duration:
+            return True
+    return False
+
+
+def random_window(fmt):
+    start = random.randrange(0, 22 * 60)
+    end = random.randrange(start + 1, 24 * 60)
+    if fmt == "%H:%M":
+        return {'start': f"{start // 60:02d}:{start % 60:02d}", 'end': f"{end // 60:02d}:{end % 60:02d}"}
+    return {'start': f"{start // 60:02d}:{start % 60:02d}:00", 'end': f"{end // 60:02d}:{end % 60:02d}:00"}
+
+
+def run(n_pairs):
+    # Clients send isoformat "HH:MM:SS"; mix in "HH:MM" to exercise the fallback path too.
+    pairs = [(random_window(random.choice(["%H:%M:%S", "%H:%M"])), random_window("%H:%M:%S"), 1800)
+             for _ in range(n_pairs)]
+
+    start = time.perf_counter()
+    before = [legacy_is_time_window_match(s, b, d) for s, b, d in pairs]
+    legacy_s = time.perf_counter() - start
+
+    # Ingest cost is paid once per order, not per comparison; report it separately.
+    start = time.perf_counter()
+    parsed = [(window_seconds(s), window_seconds(b), d) for s, b, d in pairs]
+    ingest_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    after = [window_contains(s, b, d) for s, b, d in parsed]
+    match_s = time.perf_counter() - start
+
+    assert before == after, "pre-parsed matching disagrees with the legacy implementation"
+    print(f"{n_pairs} window comparisons")
+    print(f"  before (strptime per comparison): {n_pairs / legacy_s:12,.0f} matches/s")
+    print(f"  after  (integer comparison):      {n_pairs / match_s:12,.0f} matches/s")
+    print(f"  one-off ingest parse:             {2 * n_pairs / ingest_s:12,.0f} windows/s")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,290 @@
+"""
+Socket-level load generator for server.py.
+
+Starts a Server on a loopback port (with a throwaway workbook in a temporary directory),
+connects N simulated clients (threads or asyncio tasks), and has each one log in and
+send a weighted mix of SELLER_REGISTER, BUYER_REQUEST, TRANSACTION, AUTO_SELLER and
+AUTO_BUYER requests, one at a time, timing every request/response round trip. Pushed
+notifications (trade notifications, book deltas) that arrive in between are counted
+but not timed. Reports messages/sec, p50 and p99 latency per message type.
+
+Usage: python benchmarks/loadgen.py [--clients 50] [--messages 200] [--server-mode threaded|asyncio]
+                                    [--client-mode threads|asyncio] [--storage excel|sqlite]
+                                    [--durability sync|async] [--mix BUYER_REQUEST=40,TRANSACTION=20,...]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from server import Server, raise_open_file_limit
+from framing import MAX_FRAME_SIZE, MessageDecoder, decode_frame, encode_message
+
+warnings.simplefilter('ignore')
+
+# Relative weight of each request type in the generated traffic.
+DEFAULT_MIX = {
+    'SELLER_REGISTER': 15,
+    'BUYER_REQUEST': 40,
+    'TRANSACTION': 20,
+    'AUTO_SELLER': 10,
+    'AUTO_BUYER': 15,
+}
+
+# Message types the server pushes on its own; everything else answers the last request.
+PUSHED_TYPES = ('TRANSACTION_NOTIFICATION', 'BOOK_SNAPSHOT', 'BOOK_DELTA', 'DAY_AHEAD_RESULT')
+
+PASSWORD = 'load'
+
+
+def parse_mix(text):
+    """Parse "TYPE=weight,TYPE=weight" into a weight dict."""
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip().upper()
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f"Unknown message type in mix: {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def hhmm(hour):
+    return f"{hour:02d}:00"
+
+
+class Workload:
+    """
+    Generates one client's requests. Seller ids registered by any client go into a
+    shared list, so TRANSACTION requests target sellers that (probably) still exist.
+    """
+    def __init__(self, username, mix, sellers, seed):
+        self.username = username
+        self.kinds = list(mix)
+        self.weights = list(mix.values())
+        self.sellers = sellers
+        self.rng = random.Random(seed)
+        self.count = 0
+
+    def seller_window(self):
+        return {'start': hhmm(self.rng.randint(6, 10)), 'end': hhmm(self.rng.randint(14, 20))}
+
+    def buyer_window(self):
+        start = self.rng.randint(10, 13)
+        return {'start': hhmm(start), 'end': hhmm(start + 1)}
+
+    def next_message(self):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        self.count += 1
+        rng = self.rng
+        if kind == 'SELLER_REGISTER':
+            seller_id = f"{self.username}-s{self.count}"
+            self.sellers.append(seller_id)
+            return {'type': kind, 'seller_id': seller_id, 'seller_name': self.username,
+                    'energy_type': 'solar', 'energy_amount': rng.randint(5, 50), 'duration': 3600,
+                    'price': rng.randint(3, 10), 'time_window': self.seller_window()}
+        if kind == 'BUYER_REQUEST':
+            return {'type': kind, 'buyer_name': self.username, 'needed_energy': rng.randint(1, 10),
+                    'duration': 3600, 'time_window': self.buyer_window()}
+        if kind == 'TRANSACTION':
+            if not self.sellers:
+                return self.next_message()
+            return {'type': kind, 'buyer_name': self.username, 'seller_id': rng.choice(self.sellers),
+                    'energy_amount': rng.randint(1, 10), 'duration': 3600, 'price': rng.randint(3, 10),
+                    'time_window': self.buyer_window(), 'allow_partial': True}
+        if kind == 'AUTO_SELLER':
+            return {'type': kind, 'seller_id': f"{self.username}-a{self.count}", 'seller_name': self.username,
+                    'energy_amount': rng.randint(5, 50), 'min_price': rng.randint(3, 8), 'duration': 3600,
+                    'time_window': self.seller_window()}
+        return {'type': kind, 'buyer_name': self.username, 'needed_energy': rng.randint(1, 10),
+                'max_price': rng.randint(5, 10), 'duration': 3600, 'time_window': self.buyer_window(),
+                'allow_partial': True}
+
+
+class Results:
+    """Latencies (seconds) per message type, collected from every client."""
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.pushed = 0
+        self.lock = threading.Lock()
+
+    def add(self, latencies, errors, pushed):
+        with self.lock:
+            for kind, values in latencies.items():
+                self.latencies.setdefault(kind, []).extend(values)
+            for kind, count in errors.items():
+                self.errors[kind] = self.errors.get(kind, 0) + count
+            self.pushed += pushed
+
+    def report(self, elapsed):
+        print(f"{'type':<16} {'count':>7} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        total = 0
+        for kind in ['AUTH'] + list(DEFAULT_MIX):
+            values = self.latencies.get(kind)
+            if not values:
+                continue
+            total += len(values)
+            p50, p99 = np.percentile(np.array(values) * 1000, [50, 99])
+            print(f"{kind:<16} {len(values):>7} {len(values) / elapsed:>9.0f} {p50:>8.2f} {p99:>8.2f} "
+                  f"{self.errors.get(kind, 0):>7}")
+        print(f"{'total':<16} {total:>7} {total / elapsed:>9.0f}")
+        print(f"{self.pushed} pushed notification(s) received")
+
+
+def is_error(response):
+    return response.get('status') in ('error', 'AUTH_FAILED')
+
+
+def run_thread_client(port, workload, messages, results, start_barrier):
+    """One simulated client on a blocking socket."""
+    latencies, errors, pushed = {}, {}, 0
+    decoder = MessageDecoder()
+    frames = []
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        start_barrier.wait()
+
+        def request(message):
+            nonlocal pushed
+            sent = time.perf_counter()
+            sock.sendall(encode_message(message))
+            while True:
+                while not frames:
+                    data = sock.recv(65536)
+                    if not data:
+                        raise ConnectionError("Server closed the connection")
+                    frames.extend(decoder.feed(data))
+                response = decode_frame(frames.pop(0))
+                if response.get('type') in PUSHED_TYPES:
+                    pushed += 1
+                    continue
+                latencies.setdefault(message['type'], []).append(time.perf_counter() - sent)
+                if is_error(response):
+                    errors[message['type']] = errors.get(message['type'], 0) + 1
+                return
+
+        request({'type': 'AUTH', 'username': workload.username, 'password': PASSWORD})
+        for _ in range(messages):
+            request(workload.next_message())
+    results.add(latencies, errors, pushed)
+
+
+async def run_async_client(port, workload, messages, results):
+    """One simulated client as an asyncio task."""
+    latencies, errors, pushed = {}, {}, 0
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=MAX_FRAME_SIZE)
+
+    async def request(message):
+        nonlocal pushed
+        sent = time.perf_counter()
+        writer.write(encode_message(message))
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Server closed the connection")
+            response = decode_frame(line)
+            if response.get('type') in PUSHED_TYPES:
+                pushed += 1
+                continue
+            latencies.setdefault(message['type'], []).append(time.perf_counter() - sent)
+            if is_error(response):
+                errors[message['type']] = errors.get(message['type'], 0) + 1
+            return
+
+    await request({'type': 'AUTH', 'username': workload.username, 'password': PASSWORD})
+    for _ in range(messages):
+        await request(workload.next_message())
+    writer.close()
+    results.add(latencies, errors, pushed)
+
+
+def drive(port, workloads, messages, client_mode, results):
+    """Run every client to completion; returns the wall-clock time taken."""
+    if client_mode == 'asyncio':
+        async def main():
+            await asyncio.gather(*(run_async_client(port, w, messages, results) for w in workloads))
+        start = time.perf_counter()
+        asyncio.run(main())
+        return time.perf_counter() - start
+    start_barrier = threading.Barrier(len(workloads) + 1)
+    threads = [threading.Thread(target=run_thread_client, args=(port, w, messages, results, start_barrier),
+                                daemon=True) for w in workloads]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def wait_for_server(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def run(clients=50, messages=200, mix=None, server_mode='threaded', client_mode='threads',
+        storage='excel', durability='sync', seed=0):
+    mix = mix or DEFAULT_MIX
+    raise_open_file_limit()
+    results = Results()
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        port = free_port()
+        # The server logs every request; keep that out of the report.
+        with contextlib.redirect_stdout(devnull):
+            server = Server(host='127.0.0.1', port=port, db_file=os.path.join(tmp, 'excell.xlsx'),
+                            storage=storage, durability=durability, gate_closure=None)
+            usernames = [f'load{i}' for i in range(clients)]
+            for username in usernames:
+                server.add_user(username, PASSWORD)
+            server.build_user_index()
+            threading.Thread(target=server.start, args=(server_mode,), daemon=True).start()
+            wait_for_server(port)
+            sellers = []
+            workloads = [Workload(username, mix, sellers, seed * 100003 + i) for i, username in enumerate(usernames)]
+            elapsed = drive(port, workloads, messages, client_mode, results)
+            server.shutdown(checkpoint=False)
+    print(f"{clients} clients x {messages} messages, server {server_mode}, clients {client_mode}, "
+          f"{storage} storage, {durability} durability: {elapsed:.2f} s")
+    results.report(elapsed)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load generator for the P2P energy trading server")
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=200, help="Requests per client after AUTH")
+    parser.add_argument('--server-mode', choices=['threaded', 'asyncio'], default='threaded')
+    parser.add_argument('--client-mode', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--storage', choices=['excel', 'sqlite'], default='excel')
+    parser.add_argument('--durability', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--mix', type=parse_mix, default=None,
+                        help="Comma-separated TYPE=weight pairs (default: %s)"
+                             % ','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.clients, args.messages, args.mix, args.server_mode, args.client_mode,
+        args.storage, args.durability, args.seed)
@@ -0,0 +1,127 @@
+"""
+Replay recorded inbound traffic (server.py --record FILE) into a fresh Server, without sockets.
+
+The server starts from a copy of the given workbook (the state the recording started
+from) in a temporary directory. Every recorded message is handled through the matching
+engine exactly as a connection's messages would be, one connection at a time in recorded
+order, so a replay is deterministic. Each recorded connection gets a null connection that
+only counts what is pushed to it. By default messages are fed as fast as the server takes
+them; --pacing keeps the recorded gaps (scaled by --speed). The day-ahead gate closure is
+not run during replay.
+
+Usage: python benchmarks/replay.py RECORDING [--db excell.xlsx] [--storage excel|sqlite]
+                                   [--durability sync|async] [--pacing] [--speed 1.0]
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from server import Server
+from recorder import read_traffic
+
+warnings.simplefilter('ignore')
+
+# Password used to replay a login that failed in the recording.
+WRONG_PASSWORD = '\0'
+
+
+class NullConnection:
+    """Stands in for a client connection: counts pushed frames and bytes, sends nothing."""
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def sendall(self, data):
+        self.frames += data.count(b'\n')
+        self.bytes += len(data)
+
+    def enqueue(self, data, coalesce_key=None):
+        self.sendall(data)
+
+    def close(self):
+        pass
+
+
+def replay(recording, db_file='excell.xlsx', storage='excel', durability='sync', pacing=False, speed=1.0):
+    latencies = {}
+    conns, usernames = {}, {}
+    pushed_frames = pushed_bytes = 0
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        replay_db = os.path.join(tmp, 'excell.xlsx')
+        if db_file and os.path.exists(db_file):
+            shutil.copy(db_file, replay_db)
+        # The server logs every request; keep that out of the report.
+        with contextlib.redirect_stdout(devnull):
+            server = Server(host='127.0.0.1', port=0, db_file=replay_db, storage=storage,
+                            durability=durability, gate_closure=None)
+            first_time = None
+            start = time.perf_counter()
+            for record in read_traffic(recording):
+                if pacing:
+                    if first_time is None:
+                        first_time = record['t']
+                    delay = (record['t'] - first_time) / speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+                conn_id = record['conn']
+                if record.get('event') == 'disconnect':
+                    conn = conns.pop(conn_id, None)
+                    if conn is not None:
+                        server.execute(server.client_disconnected, usernames.pop(conn_id, None), conn)
+                        pushed_frames += conn.frames
+                        pushed_bytes += conn.bytes
+                    continue
+                conn = conns.get(conn_id)
+                if conn is None:
+                    conn = conns[conn_id] = NullConnection()
+                message = record['msg']
+                if message.get('type') == 'AUTH':
+                    # Passwords are not recorded; log in with the one in the starting workbook.
+                    password = server.credentials.get(message.get('username')) if record.get('auth_ok') else None
+                    message = dict(message, password=password if password is not None else WRONG_PASSWORD)
+                sent = time.perf_counter()
+                _, usernames[conn_id] = server.execute(server.handle_messages, [message], usernames.get(conn_id), conn)
+                latencies.setdefault(message.get('type'), []).append(time.perf_counter() - sent)
+            elapsed = time.perf_counter() - start
+            for conn in conns.values():
+                pushed_frames += conn.frames
+                pushed_bytes += conn.bytes
+            state = {
+                'sellers': len(server.sellers),
+                'auto book orders': len(server.auto_book),
+                'day-ahead orders': len(server.day_ahead),
+                'transactions': sum(len(ledger) for ledger in server.transactions.values()),
+            }
+            server.shutdown(checkpoint=False)
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"Replayed {total} message(s) from {recording} in {elapsed:.2f} s "
+          f"({total / elapsed if elapsed else 0:,.0f} msg/s, {'paced' if pacing else 'max speed'}, "
+          f"{storage} storage, {durability} durability)")
+    print(f"{'type':<16} {'count':>7} {'mean ms':>9} {'p99 ms':>9}")
+    for kind, values in sorted(latencies.items(), key=lambda item: str(item[0])):
+        values = np.array(values) * 1000
+        print(f"{str(kind):<16} {len(values):>7} {values.mean():>9.3f} {np.percentile(values, 99):>9.3f}")
+    print(f"Pushed to clients: {pushed_frames} frame(s), {pushed_bytes} byte(s)")
+    print("Final state: " + ', '.join(f"{name} {count}" for name, count in state.items()))
+    return state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded server traffic")
+    parser.add_argument('recording')
+    parser.add_argument('--db', default='excell.xlsx', help="Workbook the recording started from")
+    parser.add_argument('--storage', choices=['excel', 'sqlite'], default='excel')
+    parser.add_argument('--durability', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--pacing', action='store_true', help="Keep the recorded gaps between messages")
+    parser.add_argument('--speed', type=float, default=1.0, help="Pacing speed-up factor")
+    args = parser.parse_args()
+    replay(args.recording, args.db, args.storage, args.durability, args.pacing, args.speed)
@@ -0,0 +1,203 @@
+"""
+Microbenchmark suite for the Server hot paths, on synthetic books of 1k/10k/100k orders.
+
+Each case builds a Server (throwaway workbook in a temporary directory, no fsync) holding
+the synthetic book, then times one operation with timeit: the repeat count is fixed and
+the number of calls per repeat is calibrated with Timer.autorange(). Results are printed
+and can be written as JSON, and compared against an earlier JSON file before deploying.
+
+Cases:
+  attempt_auto_match     one auto mode buyer crossing a book of N resting auto sellers
+  is_time_window_match   filtering N seller windows against one buyer window
+  buyer_request          BUYER_REQUEST over N registered sellers, request cache disabled
+  buyer_request_cached   the same request answered from the request cache
+  update_transaction     one trade appended to a user with N transactions
+  save_database          a checkpoint of N transactions
+
+Usage: python benchmarks/suite.py [--sizes 1000 10000 100000] [--cases NAME ...] [--repeat 3]
+                                  [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from server import Server
+from storage import ExcelStorage
+from capacity import SlotCapacity
+from timewindows import window_seconds
+
+warnings.simplefilter('ignore')
+
+SELLER = 'Aarush'
+BUYER = 'Madhav'
+
+
+def hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def seller_window(rng):
+    start = rng.randrange(6 * 60, 11 * 60, 15)
+    return {'start': hhmm(start), 'end': hhmm(rng.randrange(13 * 60, 20 * 60, 15))}
+
+
+BUYER_WINDOW = {'start': '11:00', 'end': '12:00'}
+
+
+def make_server(tmp, request_cache_size=1024):
+    db_file = os.path.join(tmp, 'excell.xlsx')
+    server = Server(host='127.0.0.1', port=0, db_file=db_file, storage=ExcelStorage(db_file, fsync=False),
+                    compact_threshold=10**9, gate_closure=None, request_cache_size=request_cache_size)
+    server.clients[SELLER] = None
+    server.clients[BUYER] = None
+    return server
+
+
+def add_sellers(server, n, rng):
+    """Register n manual sellers the way SELLER_REGISTER does (without the summary sheet write)."""
+    for i in range(n):
+        tw = seller_window(rng)
+        window = window_seconds(tw)
+        energy_amount = rng.randint(1, 50)
+        server.add_seller(f's{i}', {
+            'seller_name': SELLER, 'energy_type': 'solar', 'energy_amount': energy_amount,
+            'duration': 3600, 'price': rng.randint(3, 10), 'time_window': tw, 'window': window,
+            'capacity': SlotCapacity(window, energy_amount), 'timestamp': datetime.now().isoformat(),
+            'conn': None
+        })
+
+
+def add_transactions(server, n, rng):
+    ledger = server.transactions[BUYER]
+    for _ in range(n):
+        ledger.append({'Transaction Time': datetime.now().isoformat(), 'Seller/Buyer': 'Buyer',
+                       'Energy Quantity (kWh)': float(rng.randint(1, 10)), 'Price per Unit': float(rng.randint(3, 10))})
+
+
+def case_attempt_auto_match(server, n, rng):
+    for i in range(n):
+        server.register_auto_seller({
+            'seller_id': f'a{i}', 'seller_name': SELLER, 'energy_amount': 10**9,
+            'min_price': rng.randint(3, 10), 'duration': 3600, 'time_window': seller_window(rng)
+        }, SELLER, match=False)
+    counter = iter(range(10**9))
+
+    def op():
+        server.attempt_auto_match({
+            'buyer_id': f'b{next(counter)}', 'buyer_name': BUYER, 'needed_energy': 1, 'max_price': 10,
+            'duration': 3600, 'time_window': BUYER_WINDOW, 'window': window_seconds(BUYER_WINDOW),
+            'allow_partial': False, 'conn': None
+        })
+    return op
+
+
+def case_is_time_window_match(server, n, rng):
+    windows = [seller_window(rng) for _ in range(n)]
+
+    def op():
+        return [tw for tw in windows if server.is_time_window_match(tw, BUYER_WINDOW, 3600)]
+    return op
+
+
+def case_buyer_request(server, n, rng):
+    add_sellers(server, n, rng)
+    message = {'type': 'BUYER_REQUEST', 'buyer_name': BUYER, 'needed_energy': 5, 'duration': 3600,
+               'time_window': BUYER_WINDOW}
+    return lambda: server.process_message(message, BUYER)
+
+
+def case_update_transaction(server, n, rng):
+    add_transactions(server, n, rng)
+    return lambda: server.update_transaction(BUYER, 'Buyer', 5.0, 7.0)
+
+
+def case_save_database(server, n, rng):
+    add_transactions(server, n, rng)
+    return server.save_database
+
+
+# name -> (setup(server, n, rng) returning the operation to time, Server keyword arguments)
+CASES = {
+    'attempt_auto_match': (case_attempt_auto_match, {}),
+    'is_time_window_match': (case_is_time_window_match, {}),
+    'buyer_request': (case_buyer_request, {'request_cache_size': 0}),
+    'buyer_request_cached': (case_buyer_request, {}),
+    'update_transaction': (case_update_transaction, {}),
+    'save_database': (case_save_database, {}),
+}
+
+
+def run_case(name, n, repeat):
+    setup, server_kwargs = CASES[name]
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        # The server logs every order and trade; keep that out of the results.
+        with contextlib.redirect_stdout(devnull):
+            server = make_server(tmp, **server_kwargs)
+            try:
+                op = setup(server, n, random.Random(n))
+                timer = timeit.Timer(op)
+                number, _ = timer.autorange()
+                timings = [t / number for t in timer.repeat(repeat, number)]
+            finally:
+                server.shutdown(checkpoint=False)
+    timings.sort()
+    return {'case': name, 'size': n, 'number': number, 'repeat': repeat,
+            'best_s': timings[0], 'median_s': timings[len(timings) // 2], 'ops_per_s': 1 / timings[0]}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(sizes=(1000, 10000, 100000), cases=None, repeat=3, output=None, compare=None):
+    baseline = {}
+    if compare:
+        with open(compare) as f:
+            baseline = {(r['case'], r['size']): r for r in json.load(f)['results']}
+    results = []
+    print(f"{'case':<22} {'size':>7} {'best':>12} {'median':>12} {'ops/s':>12} {'vs baseline':>12}")
+    for name in cases or CASES:
+        for n in sizes:
+            result = run_case(name, n, repeat)
+            results.append(result)
+            old = baseline.get((name, n))
+            change = f"{old['best_s'] / result['best_s']:>11.2f}x" if old else ''
+            print(f"{name:<22} {n:>7} {result['best_s'] * 1e6:>10.1f}us {result['median_s'] * 1e6:>10.1f}us "
+                  f"{result['ops_per_s']:>12,.0f} {change:>12}")
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the Server hot paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="Earlier JSON results; prints the speedup against them")
+    args = parser.parse_args()
+    run(args.sizes, args.cases, args.repeat, args.output, args.compare)
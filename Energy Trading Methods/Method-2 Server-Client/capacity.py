@@ -0,0 +1,71 @@
+import numpy as np
+from timewindows import SECONDS_PER_DAY
+
+SLOT_SECONDS = 15 * 60
+SLOTS_PER_DAY = SECONDS_PER_DAY // SLOT_SECONDS
+
+# Quantities within this of each other are treated as equal (float rounding).
+EPSILON = 1e-9
+# Available energy is reported rounded to this many decimals, so the slot shares of an
+# offer add back up to the offer rather than to 12.999999999999998.
+DECIMALS = 9
+
+
+def slot_range(window):
+    """Return the (first, last + 1) slot indices covering a (start, end) window in seconds."""
+    return window[0] // SLOT_SECONDS, -(-window[1] // SLOT_SECONDS)
+
+
+class SlotCapacity:
+    """
+    A seller's energy offer tracked per 15-minute slot of the day.
+    energy_amount is the seller's total offer, spread evenly over the slots of its window.
+    A reservation draws energy only from the slots a buyer's window covers, so buyers with
+    non-overlapping sub-windows each get the share of their own slots, and together never
+    more than the offer. Availability over a window is the capacity left in its slots, a
+    single slice operation on the capacity and reserved arrays.
+
+    A buyer asking for part of the seller's window therefore only sees that part's share:
+    10 kWh offered over 18:00-21:00 is 3.33 kWh over 18:00-19:00, so a 5 kWh request for
+    that hour no longer matches (with a single scalar amount it took the whole offer).
+    """
+    def __init__(self, window, energy_amount):
+        self.reserved = np.zeros(SLOTS_PER_DAY)
+        self.set_offer(window, energy_amount)
+
+    def set_offer(self, window, energy_amount):
+        """(Re)spread the offer over the slots of window; existing reservations are kept."""
+        self.window = window
+        self.energy_amount = energy_amount
+        self.capacity = np.zeros(SLOTS_PER_DAY)
+        first, last = slot_range(window)
+        if first < last:
+            self.capacity[first:last] = energy_amount / (last - first)
+            # The last slot takes the rounding remainder, so the shares add up to the offer.
+            self.capacity[last - 1] = energy_amount - self.capacity[first:last - 1].sum()
+
+    def headroom(self, window):
+        """Capacity left in each slot of window."""
+        first, last = slot_range(window)
+        return np.maximum(self.capacity[first:last] - self.reserved[first:last], 0.0)
+
+    def available(self, window):
+        """Energy that can still be reserved over window."""
+        return round(float(self.headroom(window).sum()), DECIMALS)
+
+    def reserve(self, window, energy):
+        """Reserve energy over window; returns False (and reserves nothing) if it is not available."""
+        headroom = self.headroom(window)
+        total = float(headroom.sum())
+        if energy > total + EPSILON:
+            return False
+        if energy > 0 and total > 0:
+            # Each slot gives up the same fraction of what it has left (all of it, up to rounding).
+            first, last = slot_range(window)
+            fraction = 1.0 if energy >= total - EPSILON else energy / total
+            self.reserved[first:last] += headroom * fraction
+        return True
+
+    def remaining(self):
+        """Energy still available over the seller's own window."""
+        return self.available(self.window)
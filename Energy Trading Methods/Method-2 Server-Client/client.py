@@ -2,10 +2,10 @@ import socket
 import sys
 import threading
 import time
-import json
 import uuid
 import queue
 import math
+from framing import MessageDecoder, decode_frame, send_message
 from datetime import datetime, timedelta
 # Import openpyxl for Excel logging (if available)
 try:
@@ -43,6 +43,12 @@ class P2PClient:
         self.username = None
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.response_queue = queue.Queue()  # For synchronous responses
+        # Local view of the sellers matching our order book subscription (seller_id -> info),
+        # kept current by BOOK_SNAPSHOT / BOOK_DELTA messages pushed by the server.
+        self.book_view = {}
+        self.book_lock = threading.Lock()
+        self.book_changed = threading.Event()
+        self.subscribed = False
 
     def connect_to_server(self):
         try:
@@ -61,41 +67,20 @@ class P2PClient:
         If a message is a transaction notification, handle it immediately.
         Otherwise, place the message into the response queue for synchronous requests.
         """
+        decoder = MessageDecoder()
         while True:
             try:
-                data = self.sock.recv(4096)
+                data = self.sock.recv(65536)
                 if not data:
                     # Connection closed
                     break
-                try:
-                    msg = json.loads(data.decode())
-                except Exception as e:
-                    print("Error decoding message:", e)
-                    continue
-
-                # If the message is a transaction notification, handle it immediately.
-                if msg.get("type") == "TRANSACTION_NOTIFICATION":
-                    duration = msg.get("duration")
-                    current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-                    if duration is not None:
-                        hours, remainder = divmod(duration, 3600)
-                        minutes, seconds = divmod(remainder, 60)
-                        print(f"\nTransaction completed for {hours} Hours: {minutes} Minutes: {seconds} Seconds at {current_time}.")
-
-                    else:
-                        print(f"\nTransaction completed at {current_time}.")
-                    if hasattr(self, 'role'):
-                        if self.role == 'seller':
-                            threading.Thread(target=self.seller_led, args=(duration,), daemon=True).start()
-                        elif self.role == 'buyer':
-                            threading.Thread(target=self.buyer_led, args=(duration,), daemon=True).start()
-                        else:
-                            print("Unknown role. No LED triggered.")
-                    else:
-                        print("Role not set. No LED triggered.")
-                else:
-                    # Otherwise, place the message in the response queue.
-                    self.response_queue.put(msg)
+                for frame in decoder.feed(data):
+                    try:
+                        msg = decode_frame(frame)
+                    except Exception as e:
+                        print("Error decoding message:", e)
+                        continue
+                    self.dispatch_message(msg)
             except socket.error as e:
                 print("Socket error in receive_messages:", e)
                 break
@@ -103,6 +88,90 @@ class P2PClient:
                 print("Error receiving data:", e)
                 break
 
+    def dispatch_message(self, msg):
+        """Handle one message from the server (notification or synchronous response)."""
+        # If the message is a transaction notification, handle it immediately.
+        if msg.get("type") == "TRANSACTION_NOTIFICATION":
+            duration = msg.get("duration")
+            current_time = time.strftime("%Y-%m-%d %H:%M:%S")
+            if duration is not None:
+                hours, remainder = divmod(duration, 3600)
+                minutes, seconds = divmod(remainder, 60)
+                print(f"\nTransaction completed for {hours} Hours: {minutes} Minutes: {seconds} Seconds at {current_time}.")
+
+            else:
+                print(f"\nTransaction completed at {current_time}.")
+            if msg.get("remaining_energy"):
+                print(f"Partial fill of {msg.get('energy_amount')} kWh; {msg['remaining_energy']} kWh still waiting on the book.")
+            if hasattr(self, 'role'):
+                if self.role == 'seller':
+                    threading.Thread(target=self.seller_led, args=(duration,), daemon=True).start()
+                elif self.role == 'buyer':
+                    threading.Thread(target=self.buyer_led, args=(duration,), daemon=True).start()
+                else:
+                    print("Unknown role. No LED triggered.")
+            else:
+                print("Role not set. No LED triggered.")
+        elif msg.get("type") in ("BOOK_SNAPSHOT", "BOOK_DELTA"):
+            self.apply_book_message(msg)
+        elif msg.get("type") == "DAY_AHEAD_RESULT":
+            tw = msg.get("time_window", {})
+            if msg.get("filled_energy"):
+                print(f"\nDay-ahead {msg.get('side')} for {tw.get('start')}-{tw.get('end')}: "
+                      f"{msg['filled_energy']} of {msg.get('energy_amount')} kWh cleared at {msg.get('price')} per kWh.")
+            else:
+                print(f"\nDay-ahead {msg.get('side')} for {tw.get('start')}-{tw.get('end')} was not filled.")
+        else:
+            # Otherwise, place the message in the response queue.
+            self.response_queue.put(msg)
+
+    def apply_book_message(self, msg):
+        """Update the local seller view from a pushed snapshot or delta."""
+        with self.book_lock:
+            if msg['type'] == 'BOOK_SNAPSHOT':
+                self.book_view = {seller['seller_id']: seller for seller in msg.get('sellers', [])}
+            elif msg.get('action') == 'remove':
+                self.book_view.pop(msg.get('seller_id'), None)
+            else:
+                seller = msg['seller']
+                self.book_view[seller['seller_id']] = seller
+        self.book_changed.set()
+
+    def subscribe_book(self):
+        """Subscribe to sellers matching the current buyer request (replaces any earlier subscription)."""
+        send_message(self.sock, {
+            'type': 'SUBSCRIBE',
+            'time_window': self.trading_window,
+            'min_energy': self.needed_energy,
+            'duration': self.duration
+        })
+        response_data = self.get_response()
+        self.subscribed = response_data.get("status") == "subscribed"
+        return self.subscribed
+
+    def unsubscribe_book(self):
+        if self.subscribed:
+            send_message(self.sock, {'type': 'UNSUBSCRIBE'})
+            self.get_response()
+            self.subscribed = False
+        with self.book_lock:
+            self.book_view = {}
+
+    def wait_for_sellers(self, timeout=60):
+        """
+        Block until the local view holds at least one seller, for at most timeout seconds;
+        returns them cheapest first (an empty list if none appeared in time).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.book_changed.clear()
+            with self.book_lock:
+                sellers = sorted(self.book_view.values(), key=lambda seller: seller['price'])
+            remaining = deadline - time.monotonic()
+            if sellers or remaining <= 0:
+                return sellers
+            self.book_changed.wait(remaining)
+
     def get_response(self):
         """
         Block until a response (non-notification) is available in the queue.
@@ -117,7 +186,7 @@ class P2PClient:
             'username': self.username,
             'password': password
         }
-        self.sock.sendall(json.dumps(auth_message).encode())
+        send_message(self.sock, auth_message)
         response_data = self.get_response()
         if response_data.get("status") == "AUTH_SUCCESS":
             print("Authentication successful.")
@@ -260,7 +329,7 @@ class P2PClient:
             'time_window': {'start': start_time, 'end': end_time},
             'username': self.username
         }
-        self.sock.sendall(json.dumps(auto_message).encode())
+        send_message(self.sock, auto_message)
         response_data = self.get_response()
         print("Server response:", response_data.get("status"))
 
@@ -274,6 +343,7 @@ class P2PClient:
             duration = self.cal_total_sec(duration_input)
             # Instead of asking for a transaction date, get a trading time window.
             start_time, end_time = self.get_time_window()
+            allow_partial = input("Accept partial fills from several sellers? (y/n): ").strip().lower() == 'y'
         except ValueError:
             print("Invalid numeric input. Auto mode transaction aborted.")
             return
@@ -286,9 +356,32 @@ class P2PClient:
             'duration': duration,
             # Include the time window.
             'time_window': {'start': start_time, 'end': end_time},
+            'allow_partial': allow_partial,
             'username': self.username
         }
-        self.sock.sendall(json.dumps(auto_message).encode())
+        send_message(self.sock, auto_message)
+        response_data = self.get_response()
+        print("Server response:", response_data.get("status"))
+
+    def day_ahead_order(self):
+        """Submit a bid or ask to the day-ahead auction, cleared by the server at gate closure."""
+        side = input("Bid to buy (1) or ask to sell (2)? ")
+        if side not in ('1', '2'):
+            print("Invalid selection for day-ahead order.")
+            return
+        try:
+            energy_amount = float(input("Enter energy quantity (in kWh): "))
+            price = float(input("Enter limit price per kWh: "))
+            start_time, end_time = self.get_time_window()
+        except ValueError:
+            print("Invalid numeric input. Day-ahead order aborted.")
+            return
+        send_message(self.sock, {
+            'type': 'DAY_AHEAD_BID' if side == '1' else 'DAY_AHEAD_ASK',
+            'energy_amount': energy_amount,
+            'price': price,
+            'time_window': {'start': start_time, 'end': end_time}
+        })
         response_data = self.get_response()
         print("Server response:", response_data.get("status"))
 
@@ -299,7 +392,8 @@ class P2PClient:
             print("2. Buyer")
             print("3. Auto Mode Transaction")
             print("4. Exit")
-            choice = input("Enter your choice (1, 2, or 3): ")
+            print("5. Day-ahead Auction")
+            choice = input("Enter your choice (1, 2, 3, 4 or 5): ")
             if choice == '1':
                 self.register_seller()
             elif choice == '2':
@@ -315,6 +409,8 @@ class P2PClient:
 
             elif choice == '3':
                 self.auto_mode()
+            elif choice == '5':
+                self.day_ahead_order()
             else:
                 print("Invalid choice. Please try again.")
     def cal_total_sec(self,duration):
@@ -352,7 +448,7 @@ class P2PClient:
             'price': price,
             'username': self.username
         }
-        self.sock.sendall(json.dumps(seller_message).encode())
+        send_message(self.sock, seller_message)
         response_data = self.get_response()
         if response_data.get("status") == "seller_registered":
             print(f"You are registered as a seller with unique ID: {seller_id}")
@@ -384,7 +480,7 @@ class P2PClient:
                     'value': new_price,
                     'username': self.username
                 }
-                self.sock.sendall(json.dumps(update_message).encode())
+                send_message(self.sock, update_message)
                 response_data = self.get_response()
                 print(response_data.get("message", "Price updated."))
             elif choice == '2':
@@ -400,7 +496,7 @@ class P2PClient:
                     'value': new_amount,
                     'username': self.username
                 }
-                self.sock.sendall(json.dumps(update_message).encode())
+                send_message(self.sock, update_message)
                 response_data = self.get_response()
                 print(response_data.get("message", "Energy amount updated."))
             elif choice == '3':
@@ -409,7 +505,7 @@ class P2PClient:
                     'seller_id': seller_id,
                     'username': self.username
                 }
-                self.sock.sendall(json.dumps(exit_message).encode())
+                send_message(self.sock, exit_message)
                 response_data = self.get_response()
                 print(response_data.get("message", "Exited seller menu."))
                 self.user_interaction_loop()
@@ -472,7 +568,7 @@ class P2PClient:
             'time_window': self.trading_window,
             'username': self.username
         }
-        self.sock.sendall(json.dumps(buyer_message).encode())
+        send_message(self.sock, buyer_message)
         response_data = self.get_response()
         available_sellers = response_data.get("available_sellers", [])
         if not available_sellers:
@@ -508,7 +604,7 @@ class P2PClient:
             'time_window': self.trading_window,
             'username': self.username
         }
-        self.sock.sendall(json.dumps(transaction_message).encode())
+        send_message(self.sock, transaction_message)
         response_data = self.get_response()
         if response_data.get("status") == "transaction_success":
             current_time = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -529,22 +625,14 @@ class P2PClient:
             print("3. Exit")
             buyer_choice = input("Enter your choice: ")
             if buyer_choice == '1':
-                print("Waiting... Press Enter when you want to refresh the seller list")
-                input()
-                # Resend the buyer request with stored values.
-                buyer_message = {
-                    'type': 'BUYER_REQUEST',
-                    'buyer_name': self.username,
-                    'needed_energy': self.needed_energy,
-                    'duration': self.duration,
-                    'time_window': self.trading_window,
-                    'username': self.username
-                }
-                self.sock.sendall(json.dumps(buyer_message).encode())
-                response_data = self.get_response()
-                sellers = response_data.get("available_sellers", [])
+                # The server pushes seller changes to our local view; no need to poll.
+                if not self.subscribed and not self.subscribe_book():
+                    print("Could not subscribe to seller updates.")
+                    continue
+                print("Waiting up to a minute for a seller matching your request...")
+                sellers = self.wait_for_sellers()
                 if not sellers:
-                    print("No sellers available with matching time window.")
+                    print("No matching seller appeared yet. Returning to buyer menu.")
                     continue
                 print("\nAvailable Sellers (Updated List):")
                 for idx, seller in enumerate(sellers, start=1):
@@ -571,7 +659,7 @@ class P2PClient:
                     'time_window': self.trading_window,
                     'username': self.username
                 }
-                self.sock.sendall(json.dumps(transaction_message).encode())
+                send_message(self.sock, transaction_message)
                 response_data = self.get_response()
                 if response_data.get("status") == "transaction_success":
                     current_time = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -579,6 +667,7 @@ class P2PClient:
                     details = (f"Bought {self.needed_energy} kWh from seller {selected_seller['seller_id']} "
                             f"at {selected_seller['price']} per kWh within time window {self.trading_window}.")
                     self.log_transaction("Buyer Transaction", details)
+                    self.unsubscribe_book()
                     break
                 else:
                     print("Transaction failed. Returning to buyer menu.")
@@ -593,6 +682,8 @@ class P2PClient:
                 print("Update the trading time window:")
                 self.trading_window = {}
                 self.trading_window['start'], self.trading_window['end'] = self.get_time_window()
+                # Any seller subscription was for the old request.
+                self.unsubscribe_book()
                 buyer_message = {
                     'type': 'BUYER_REQUEST',
                     'buyer_name': self.username,
@@ -601,7 +692,7 @@ class P2PClient:
                     'time_window': self.trading_window,
                     'username': self.username
                 }
-                self.sock.sendall(json.dumps(buyer_message).encode())
+                send_message(self.sock, buyer_message)
                 print("Buyer request updated. Please wait for updated seller list.")
                 response_data = self.get_response()
                 sellers = response_data.get("available_sellers", [])
@@ -633,7 +724,7 @@ class P2PClient:
                     'time_window': self.trading_window,
                     'username': self.username
                 }
-                self.sock.sendall(json.dumps(transaction_message).encode())
+                send_message(self.sock, transaction_message)
                 response_data = self.get_response()
                 if response_data.get("status") == "transaction_success":
                     current_time = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -646,6 +737,7 @@ class P2PClient:
                     print("Transaction failed. Returning to buyer menu.")
             elif buyer_choice == '3':
                 print("Exiting buyer menu.")
+                self.unsubscribe_book()
                 break
             else:
                 print("Invalid selection, please try again.")
@@ -0,0 +1,57 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class MatchingEngine:
+    """
+    Single thread that owns the trading state (sellers, buyers, the auto mode book).
+    I/O threads only parse and reply: they submit commands (a callable plus arguments),
+    which run one at a time in submission order, so the order book needs no lock and
+    every client sees the same deterministic sequence of events. submit() returns a
+    concurrent.futures.Future for the command's result.
+    """
+    def __init__(self, max_queue=0):
+        self.commands = queue.Queue(max_queue)
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name='matching-engine', daemon=True)
+        self.thread.start()
+
+    def in_engine_thread(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) for the engine thread; returns a Future."""
+        if self.stopped:
+            raise RuntimeError("Matching engine is stopped")
+        future = Future()
+        self.commands.put((future, fn, args))
+        return future
+
+    def call(self, fn, *args):
+        """Run fn(*args) on the engine thread and return its result (inline if already on it)."""
+        if self.in_engine_thread():
+            return fn(*args)
+        return self.submit(fn, *args).result()
+
+    def stop(self):
+        """Run every command already queued, then stop the thread."""
+        if self.stopped:
+            return
+        self.stopped = True
+        self.commands.put(None)
+        if not self.in_engine_thread():
+            self.thread.join()
+
+    def run(self):
+        while True:
+            item = self.commands.get()
+            if item is None:
+                break
+            future, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
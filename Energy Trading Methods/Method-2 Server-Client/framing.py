@@ -0,0 +1,79 @@
+import json
+
+# Largest frame accepted before the peer is considered broken (1 MiB).
+MAX_FRAME_SIZE = 1 << 20
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+def encode_message(message):
+    """
+    Encode a message as one newline-terminated JSON frame.
+    json.dumps never emits a raw newline (they are escaped inside strings), so the
+    newline unambiguously ends the frame.
+    """
+    return json.dumps(message).encode() + b'\n'
+
+
+def send_message(sock, message, coalesce_key=None):
+    """
+    Send one frame. On an outbound queue (see outbound.py) a coalesce_key lets a newer
+    message replace a still-unsent one with the same key; plain sockets ignore it.
+    """
+    if coalesce_key is not None and hasattr(sock, 'enqueue'):
+        sock.enqueue(encode_message(message), coalesce_key)
+    else:
+        sock.sendall(encode_message(message))
+
+
+def send_messages(sock, messages):
+    """Send several frames with a single sendall (pipelining)."""
+    sock.sendall(b''.join(encode_message(message) for message in messages))
+
+
+class MessageDecoder:
+    """
+    Streaming decoder for newline-delimited JSON frames.
+    feed() accepts whatever recv() returned and gives back every complete frame, so a
+    message split over several reads, or several messages arriving in one read, are
+    both handled. With legacy=True a buffered, newline-less chunk that is itself a
+    complete JSON object is accepted as a frame too, so peers that still send one bare
+    JSON object per send keep working.
+    """
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE, legacy=False):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+        self.legacy = legacy
+
+    def feed(self, data):
+        """Return the list of complete raw frames (bytes) now available."""
+        self.buffer += data
+        frames = []
+        start = 0
+        while True:
+            end = self.buffer.find(b'\n', start)
+            if end == -1:
+                break
+            frame = bytes(self.buffer[start:end]).strip()
+            if frame:
+                frames.append(frame)
+            start = end + 1
+        del self.buffer[:start]
+        if self.legacy and self.buffer.rstrip().endswith(b'}'):
+            try:
+                json.loads(self.buffer)
+            except ValueError:
+                pass
+            else:
+                frames.append(bytes(self.buffer).strip())
+                self.buffer.clear()
+        if len(self.buffer) > self.max_frame_size:
+            raise FrameTooLarge(f"Frame exceeds {self.max_frame_size} bytes")
+        return frames
+
+
+def decode_frame(frame):
+    """Decode one raw frame; raises json.JSONDecodeError for malformed input."""
+    return json.loads(frame)
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import threading
+
+
+class Journal:
+    """
+    Append-only write-ahead log of database mutations.
+    Each mutation is written as one JSON line carrying a monotonically increasing
+    sequence number, so an append costs O(1) regardless of how much history the
+    Excel workbook already holds. The workbook remembers the last sequence number
+    it contains; on startup every journal record after that number is replayed.
+
+    A checkpoint first rotate()s the journal: the records it will cover move to a
+    separate file and new records go to a fresh one, so the workbook can be written
+    while mutations keep being appended. discard_rotated() drops them once it is saved.
+    """
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.rotated_path = path + '.old'
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.pending = 0    # Records not yet compacted (rotated or not).
+        self.rotated = 0    # Of those, records in the rotated file.
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def append(self, mutations):
+        """Write a group of mutations with a single write/flush (and fsync if enabled)."""
+        if not mutations:
+            return self.seq
+        with self.lock:
+            lines = []
+            for mutation in mutations:
+                self.seq += 1
+                record = dict(mutation)
+                record['seq'] = self.seq
+                lines.append(json.dumps(record, default=str))
+            self.file.write('\n'.join(lines) + '\n')
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.pending += len(lines)
+            return self.seq
+
+    def replay(self):
+        """
+        Return every record in the journal, in order: those left in the rotated file by a
+        checkpoint that did not finish, then the current file.
+        A torn trailing line (the process died mid-write) is ignored.
+        """
+        records = []
+        with self.lock:
+            self.file.flush()
+            rotated = 0
+            for path in (self.rotated_path, self.path):
+                if not os.path.exists(path):
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            print(f"Journal: ignoring corrupt record in {path}")
+                            continue
+                        self.seq = max(self.seq, record.get('seq', 0))
+                        records.append(record)
+                if path == self.rotated_path:
+                    rotated = len(records)
+            self.pending = len(records)
+            self.rotated = rotated
+        return records
+
+    def rotate(self):
+        """
+        Move every record written so far to the rotated file and continue in an empty journal;
+        returns the last sequence number moved. If a previous checkpoint never discarded its
+        rotated file, the records are appended to it, so none is lost.
+        """
+        with self.lock:
+            self.file.close()
+            if os.path.exists(self.rotated_path):
+                with open(self.path, 'rb') as src, open(self.rotated_path, 'ab') as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    if self.fsync:
+                        os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.rotated_path)
+            self.file = open(self.path, 'a', encoding='utf-8')
+            self.rotated = self.pending
+            return self.seq
+
+    def discard_rotated(self):
+        """Drop the rotated records; called once the workbook holds all of them."""
+        with self.lock:
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+            self.pending -= self.rotated
+            self.rotated = 0
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+# Transaction sheet columns stored as float64 arrays; everything else is stored as objects.
+NUMERIC_COLUMNS = ('Energy Quantity (kWh)', 'Price per Unit', 'Amount of Duration')
+
+
+class Ledger:
+    """
+    Append-only, columnar transaction history for one user.
+    Rows are written into preallocated fixed-size array chunks (float64 for numeric
+    columns, object otherwise), so an append is O(1) instead of a pd.concat that copies
+    the user's whole history. A DataFrame is only built by to_frame(), for export or
+    queries, and is cached until the next append.
+    """
+    def __init__(self, columns, numeric_columns=NUMERIC_COLUMNS, chunk_size=4096):
+        self.columns = list(columns)
+        self.numeric = {col for col in self.columns if col in numeric_columns}
+        self.numeric_columns = numeric_columns
+        self.chunk_size = chunk_size
+        self.chunks = []        # Each chunk maps column -> preallocated array.
+        self.fill = 0           # Rows used in the last chunk.
+        self.frame = None       # Cached to_frame() result.
+
+    @classmethod
+    def from_frame(cls, df, numeric_columns=NUMERIC_COLUMNS, chunk_size=4096):
+        ledger = cls(df.columns, numeric_columns, chunk_size)
+        for col in ledger.numeric.copy():
+            try:
+                df[col].astype(np.float64)
+            except (TypeError, ValueError):
+                ledger.numeric.discard(col)     # Mixed data in the sheet; keep it as objects.
+        for start in range(0, len(df), chunk_size):
+            part = df.iloc[start:start + chunk_size]
+            chunk = ledger.new_chunk()
+            for col in ledger.columns:
+                chunk[col][:len(part)] = part[col].to_numpy(
+                    dtype=np.float64 if col in ledger.numeric else object)
+            ledger.fill = len(part)
+        return ledger
+
+    def __len__(self):
+        if not self.chunks:
+            return 0
+        return (len(self.chunks) - 1) * self.chunk_size + self.fill
+
+    def new_chunk(self):
+        chunk = {}
+        for col in self.columns:
+            if col in self.numeric:
+                chunk[col] = np.full(self.chunk_size, np.nan)
+            else:
+                chunk[col] = np.full(self.chunk_size, np.nan, dtype=object)
+        self.chunks.append(chunk)
+        self.fill = 0
+        return chunk
+
+    def add_column(self, col):
+        """Add a column (filled with NaN for existing rows) if it is not there yet."""
+        if col in self.columns:
+            return
+        self.columns.append(col)
+        if col in self.numeric_columns:
+            self.numeric.add(col)
+        for chunk in self.chunks:
+            chunk[col] = np.full(self.chunk_size, np.nan, dtype=np.float64 if col in self.numeric else object)
+        self.frame = None
+
+    def append(self, record):
+        """Append one row given as a {column: value} dict; unknown columns are added."""
+        for col in record:
+            if col not in self.columns:
+                self.add_column(col)
+        if not self.chunks or self.fill == self.chunk_size:
+            self.new_chunk()
+        chunk = self.chunks[-1]
+        for col, value in record.items():
+            if col in self.numeric:
+                try:
+                    value = np.nan if value is None else float(value)
+                except (TypeError, ValueError):
+                    self.make_object(col)
+            chunk[col][self.fill] = value
+        self.fill += 1
+        self.frame = None
+
+    def make_object(self, col):
+        """Switch a numeric column to object storage (a non-numeric value arrived)."""
+        self.numeric.discard(col)
+        for chunk in self.chunks:
+            chunk[col] = chunk[col].astype(object)
+
+    def to_frame(self):
+        """Materialise the ledger as a DataFrame (cached until the next append)."""
+        if self.frame is None:
+            data = {}
+            for col in self.columns:
+                parts = [chunk[col] for chunk in self.chunks[:-1]]
+                if self.chunks:
+                    parts.append(self.chunks[-1][col][:self.fill])
+                if parts:
+                    data[col] = np.concatenate(parts)
+                else:
+                    data[col] = np.empty(0, dtype=np.float64 if col in self.numeric else object)
+            self.frame = pd.DataFrame(data, columns=self.columns)
+        return self.frame
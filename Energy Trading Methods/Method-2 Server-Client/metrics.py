@@ -0,0 +1,143 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds, in seconds (100 us to 10 s).
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style: per-bucket counts, sum and count."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # The last slot is the +Inf bucket.
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    In-process metrics registry: counters and latency histograms keyed by name and labels,
+    plus gauges read from callables when the metrics are rendered (so book sizes and queue
+    depths cost nothing until scraped). render() produces the Prometheus text format and
+    serve() exposes it over HTTP on /metrics.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.descriptions = {}  # name -> (type, help)
+        self.counters = {}      # (name, labels) -> value
+        self.histograms = {}    # (name, labels) -> Histogram
+        self.gauges = {}        # name -> callable
+        self.http_server = None
+
+    def describe(self, name, kind, help_text):
+        self.descriptions[name] = (kind, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, fn, help_text, kind='gauge'):
+        """
+        Register a value read when rendering. fn returns a number; kind='counter' marks a
+        running total.
+        """
+        self.describe(name, kind, help_text)
+        self.gauges[name] = fn
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(h.counts), h.sum, h.count, h.buckets)
+                                for key, h in self.histograms.items())
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self.descriptions:
+                described.add(name)
+                kind, help_text = self.descriptions[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        for (name, labels), counts, total, count, buckets in histograms:
+            header(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', format_value(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        for name, fn in sorted(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Error reading metric {name}: {e}")
+                continue
+            header(name)
+            lines.append(f"{name} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, host='127.0.0.1', port=9100):
+        """Serve render() on http://host:port/metrics from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer((host, port), Handler)
+        self.http_server.daemon_threads = True
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        print(f"Metrics served on http://{host}:{self.http_server.server_port}/metrics")
+        return self.http_server
+
+    def close(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
@@ -0,0 +1,175 @@
+import heapq
+import itertools
+
+
+class OrderBook:
+    """
+    Price-time priority book for auto mode orders.
+    Sellers sit in a min-heap on (min_price, arrival) and buyers in a max-heap on
+    (max_price, arrival). Only a newly arrived order is matched against the opposite
+    side, so a match costs O(log n) per order touched instead of a scan of every
+    buyer/seller pair. Cancelled or filled orders are removed lazily from the heaps.
+
+    Orders are the plain dicts built by Server.process_message: sellers carry
+    'seller_id', 'energy_amount' and 'min_price'; buyers carry 'buyer_id',
+    'needed_energy' and 'max_price'. Fills decrement 'energy_amount' / 'needed_energy'
+    in place, so both always hold the quantity still open.
+
+    A buyer is filled all-or-nothing from a single seller unless it sets 'allow_partial',
+    in which case it takes whatever each crossing seller has, cheapest first, and any
+    remainder keeps resting on the book.
+    """
+    def __init__(self):
+        self.seller_heap = []   # (min_price, seq, seller_id)
+        self.buyer_heap = []    # (-max_price, seq, buyer_id)
+        self.sellers = {}       # seller_id -> order (live orders only)
+        self.buyers = {}        # buyer_id -> order (live orders only)
+        self.seq = itertools.count()
+
+    def __len__(self):
+        return len(self.sellers) + len(self.buyers)
+
+    def add_seller(self, order, match=True):
+        """
+        Match a new seller order against resting buyers, rest any remainder; return the fills.
+        With match=False the order is only rested (see match_rested()).
+        """
+        fills = self.match_seller(order) if match else []
+        if order['energy_amount'] > 0:
+            order['book_seq'] = next(self.seq)
+            self.sellers[order['seller_id']] = order
+            heapq.heappush(self.seller_heap, (order['min_price'], order['book_seq'], order['seller_id']))
+        return fills
+
+    def add_buyer(self, order, match=True):
+        """
+        Match a new buyer order against resting sellers, rest whatever is unfilled; return the fills.
+        With match=False the order is only rested (see match_rested()).
+        """
+        fills = self.match_buyer(order) if match else []
+        if order['needed_energy'] > 0:
+            order['book_seq'] = next(self.seq)
+            self.buyers[order['buyer_id']] = order
+            heapq.heappush(self.buyer_heap, (-order['max_price'], order['book_seq'], order['buyer_id']))
+        return fills
+
+    def match_buyer(self, buyer):
+        """
+        Fill the buyer from the cheapest seller (earliest first on equal price) that has
+        enough energy and whose min_price is within the buyer's max_price. A partial buyer
+        is filled from every crossing seller in that order until it is complete.
+        """
+        fills = []
+        skipped = []
+        while self.seller_heap and buyer['needed_energy'] > 0:
+            price, seq, seller_id = self.seller_heap[0]
+            seller = self.sellers.get(seller_id)
+            if seller is None or seller['book_seq'] != seq:
+                heapq.heappop(self.seller_heap)     # Stale entry.
+                continue
+            if price > buyer['max_price']:
+                break
+            heapq.heappop(self.seller_heap)
+            if seller['energy_amount'] >= buyer['needed_energy'] or buyer.get('allow_partial'):
+                fills.append(self.fill(buyer, seller))
+                if seller['energy_amount'] > 0:
+                    skipped.append((price, seq, seller_id))
+                continue
+            skipped.append((price, seq, seller_id))
+        for entry in skipped:
+            heapq.heappush(self.seller_heap, entry)
+        return fills
+
+    def match_seller(self, seller):
+        """
+        Fill resting buyers from the new seller, highest max_price first (earliest first on
+        equal price), while the seller has energy left and the prices cross.
+        """
+        fills = []
+        skipped = []
+        while self.buyer_heap and seller['energy_amount'] > 0:
+            neg_price, seq, buyer_id = self.buyer_heap[0]
+            buyer = self.buyers.get(buyer_id)
+            if buyer is None or buyer['book_seq'] != seq:
+                heapq.heappop(self.buyer_heap)      # Stale entry.
+                continue
+            if -neg_price < seller['min_price']:
+                break
+            heapq.heappop(self.buyer_heap)
+            if seller['energy_amount'] >= buyer['needed_energy']:
+                del self.buyers[buyer_id]
+                fills.append(self.fill(buyer, seller))
+            elif buyer.get('allow_partial'):
+                # The seller runs out here; the rest of the buyer keeps its place.
+                fills.append(self.fill(buyer, seller))
+                skipped.append((neg_price, seq, buyer_id))
+            else:
+                skipped.append((neg_price, seq, buyer_id))
+        for entry in skipped:
+            heapq.heappush(self.buyer_heap, entry)
+        return fills
+
+    def match_rested(self, orders):
+        """
+        Match orders that were just rested with match=False (a batch), in arrival order:
+        each seller against the resting buyers, each buyer against the resting sellers.
+        Only these orders are matched, so a batch costs what adding its orders one by one
+        would, however large the rest of the book is. Returns the fills.
+        """
+        fills = []
+        for order in orders:
+            if 'seller_id' in order:
+                if self.sellers.get(order['seller_id']) is order:
+                    fills.extend(self.match_seller(order))
+            elif self.buyers.get(order['buyer_id']) is order:
+                fills.extend(self.match_buyer(order))
+                if order['needed_energy'] <= 0:
+                    del self.buyers[order['buyer_id']]
+        self.compact()
+        return fills
+
+    def fill(self, buyer, seller):
+        """
+        Fill the buyer order from the seller at the seller's minimum price: all of it, or for a
+        partial buyer as much as the seller has left.
+        """
+        energy = min(buyer['needed_energy'], seller['energy_amount'])
+        buyer['needed_energy'] -= energy
+        seller['energy_amount'] -= energy
+        if seller['energy_amount'] <= 0:
+            self.sellers.pop(seller['seller_id'], None)
+        return {'buyer': buyer, 'seller': seller, 'energy_amount': energy, 'price': seller['min_price'],
+                'remaining_energy': buyer['needed_energy']}
+
+    def remove_seller(self, seller_id):
+        order = self.sellers.pop(seller_id, None)
+        self.compact()
+        return order
+
+    def remove_buyer(self, buyer_id):
+        order = self.buyers.pop(buyer_id, None)
+        self.compact()
+        return order
+
+    def restore(self, sellers, buyers):
+        """
+        Load resting orders (seller_id -> order, buyer_id -> order) saved from another book,
+        keeping their arrival order ('book_seq'), and rebuild the heaps.
+        """
+        self.sellers = dict(sellers)
+        self.buyers = dict(buyers)
+        self.seller_heap = [(o['min_price'], o['book_seq'], sid) for sid, o in self.sellers.items()]
+        self.buyer_heap = [(-o['max_price'], o['book_seq'], bid) for bid, o in self.buyers.items()]
+        heapq.heapify(self.seller_heap)
+        heapq.heapify(self.buyer_heap)
+        last_seq = max((o['book_seq'] for o in itertools.chain(self.sellers.values(), self.buyers.values())), default=-1)
+        self.seq = itertools.count(last_seq + 1)
+
+    def compact(self):
+        """Rebuild a heap once stale entries outnumber live orders, so it cannot grow without bound."""
+        if len(self.seller_heap) > 2 * len(self.sellers) + 64:
+            self.seller_heap = [(o['min_price'], o['book_seq'], sid) for sid, o in self.sellers.items()]
+            heapq.heapify(self.seller_heap)
+        if len(self.buyer_heap) > 2 * len(self.buyers) + 64:
+            self.buyer_heap = [(-o['max_price'], o['book_seq'], bid) for bid, o in self.buyers.items()]
+            heapq.heapify(self.buyer_heap)
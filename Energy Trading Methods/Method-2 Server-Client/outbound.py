@@ -0,0 +1,243 @@
+import asyncio
+import collections
+import selectors
+import socket
+import threading
+
+# Bytes a connection may have queued before it is considered stalled and disconnected.
+HIGH_WATER = 8 * 1024 * 1024
+# Lets the shared writer send to a blocking socket without waiting for buffer space. Where
+# the flag does not exist (Windows), a client with a full socket buffer stalls the writer.
+SEND_FLAGS = getattr(socket, 'MSG_DONTWAIT', 0)
+
+
+class OutboundQueue:
+    """
+    Per-connection buffer of encoded frames, so whoever notifies a client never blocks on
+    its socket. sendall() only enqueues; a writer (thread or asyncio task, see the
+    subclasses) drains the queue, joining everything queued into one write.
+
+    A frame queued with a coalesce key replaces a still-queued frame with the same key,
+    so a slow client gets only the latest version of e.g. a book update. If a client
+    still lets high_water bytes pile up, it is disconnected rather than left to hold
+    memory and delay everyone else.
+    """
+    def __init__(self, high_water=HIGH_WATER):
+        self.high_water = high_water
+        self.frames = collections.deque()   # [coalesce_key, data] entries
+        self.keyed = {}                     # coalesce_key -> queued entry
+        self.queued_bytes = 0
+        self.lock = threading.Lock()
+        self.closed = False
+        self.max_depth = 0
+        self.max_bytes = 0
+        self.coalesced = 0
+        self.overflowed = False
+
+    @property
+    def depth(self):
+        return len(self.frames)
+
+    def sendall(self, data):
+        self.enqueue(data)
+
+    def enqueue(self, data, coalesce_key=None):
+        """Queue one encoded frame; raises ConnectionError if the connection is closed or stalled."""
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("Connection closed")
+            if coalesce_key is not None and coalesce_key in self.keyed:
+                entry = self.keyed[coalesce_key]
+                self.queued_bytes += len(data) - len(entry[1])
+                entry[1] = data
+                self.coalesced += 1
+                return
+            if self.queued_bytes + len(data) > self.high_water:
+                self.overflowed = True
+                overflow = True
+            else:
+                overflow = False
+                entry = [coalesce_key, data]
+                self.frames.append(entry)
+                if coalesce_key is not None:
+                    self.keyed[coalesce_key] = entry
+                self.queued_bytes += len(data)
+                self.max_depth = max(self.max_depth, len(self.frames))
+                self.max_bytes = max(self.max_bytes, self.queued_bytes)
+        if overflow:
+            print(f"Outbound queue exceeded {self.high_water} bytes; disconnecting stalled client.")
+            self.close()
+            raise ConnectionError("Outbound queue full")
+        self.wake()
+
+    def take(self):
+        """Remove and return everything queued, as one bytes object."""
+        with self.lock:
+            data = b''.join(entry[1] for entry in self.frames)
+            self.frames.clear()
+            self.keyed.clear()
+            self.queued_bytes = 0
+        return data
+
+    def mark_closed(self):
+        """Mark closed and drop queued frames; returns False if it already was closed."""
+        with self.lock:
+            if self.closed:
+                return False
+            self.closed = True
+            self.frames.clear()
+            self.keyed.clear()
+            self.queued_bytes = 0
+        return True
+
+
+class ThreadedConnection(OutboundQueue):
+    """
+    Outbound queue for a blocking socket. The socket is read by the connection's own
+    thread; what is queued is written by a ConnectionWriter shared by every connection.
+    """
+    def __init__(self, sock, writer, high_water=HIGH_WATER):
+        super().__init__(high_water)
+        self.sock = sock
+        self.writer = writer
+        self.unsent = b''           # Taken from the queue but not accepted by the socket yet.
+        self.registered = False     # Waiting in the writer's selector for the socket to drain.
+
+    def recv(self, bufsize):
+        return self.sock.recv(bufsize)
+
+    def wake(self):
+        self.writer.wake(self)
+
+    def close(self):
+        if not self.mark_closed():
+            return
+        # Shutting the socket down also wakes the reader blocked in recv(), which then cleans up.
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        # The writer closes the socket, once it no longer watches it.
+        self.wake()
+
+
+class ConnectionWriter:
+    """
+    One thread writing the outbound queues of every ThreadedConnection, so a threaded
+    client costs one thread (its reader) rather than a reader and a writer each.
+    A connection with frames queued is written without blocking; whatever its socket does
+    not take is kept and the socket is watched with a selector until it can take more, so
+    a slow client never holds up the others (its queue grows towards the high-water mark
+    instead). Other threads wake the writer through a socket pair.
+    """
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.woken = set()          # Connections with new frames (or closed) since the last round.
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.wake_send.setblocking(False)
+        self.selector.register(self.wake_recv, selectors.EVENT_READ)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def wake(self, conn):
+        with self.lock:
+            first = not self.woken
+            self.woken.add(conn)
+        if first:
+            try:
+                self.wake_send.send(b'\0')
+            except OSError:
+                pass    # Buffer full: the writer has a wake-up pending anyway.
+
+    def run(self):
+        while True:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.wake_recv:
+                    try:
+                        while self.wake_recv.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    with self.lock:
+                        woken, self.woken = self.woken, set()
+                    for conn in woken:
+                        self.write(conn)
+                else:
+                    self.write(key.data)
+
+    def write(self, conn):
+        """Send what the connection's socket takes now; watch it if anything is left."""
+        if not conn.closed:
+            if not conn.unsent:
+                conn.unsent = memoryview(conn.take())
+            if conn.unsent:
+                try:
+                    sent = conn.sock.send(conn.unsent, SEND_FLAGS)
+                except (BlockingIOError, InterruptedError):
+                    sent = 0
+                except OSError:
+                    conn.close()
+                    sent = 0
+                conn.unsent = conn.unsent[sent:]
+        if conn.closed:
+            self.watch(conn, False)
+            conn.unsent = b''
+            conn.sock.close()
+            return
+        self.watch(conn, bool(conn.unsent))
+
+    def watch(self, conn, wanted):
+        if wanted != conn.registered:
+            if wanted:
+                self.selector.register(conn.sock, selectors.EVENT_WRITE, conn)
+            else:
+                self.selector.unregister(conn.sock)
+            conn.registered = wanted
+
+
+class AsyncConnection(OutboundQueue):
+    """
+    Socket-like outbound queue around an asyncio StreamWriter, so the code that notifies
+    counterparties with conn.sendall() works unchanged in asyncio mode. A writer task
+    drains the queue, awaiting drain() so a slow client's frames wait here, where the
+    high-water mark can see them. Calls from other threads (the matching engine) are
+    handed to the loop thread.
+    """
+    def __init__(self, writer, loop, high_water=HIGH_WATER):
+        super().__init__(high_water)
+        self.writer = writer
+        self.loop = loop
+        self.loop_thread = threading.current_thread()
+        self.ready = asyncio.Event()
+        self.task = loop.create_task(self.run())
+
+    def call_in_loop(self, fn):
+        if threading.current_thread() is self.loop_thread:
+            fn()
+        else:
+            self.loop.call_soon_threadsafe(fn)
+
+    def wake(self):
+        self.call_in_loop(self.ready.set)
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            if self.closed:
+                return
+            data = self.take()
+            if data:
+                try:
+                    self.writer.write(data)
+                    await self.writer.drain()
+                except (ConnectionError, OSError):
+                    self.close()
+                    return
+
+    def close(self):
+        if not self.mark_closed():
+            return
+        self.wake()
+        self.call_in_loop(self.writer.close)
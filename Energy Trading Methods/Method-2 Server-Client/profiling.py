@@ -0,0 +1,91 @@
+import cProfile
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class Profiler:
+    """
+    Opt-in deterministic profiling of a running server. Once started (by SIGUSR1 or a PROFILE
+    admin message), every message handled through call() runs under a cProfile profile kept
+    per message type, until the requested number of messages has been handled or the time is
+    up. Then each handler's profile is written to output_dir as <timestamp>-<type>.prof, for
+    pstats or snakeviz. Messages are handled one at a time on the matching engine thread, so
+    the profiles never overlap. A time limit is also enforced by a timer, so a profile of an
+    idle server still stops (and is written) on time.
+    """
+    def __init__(self, output_dir='profiles', default_messages=1000):
+        self.output_dir = output_dir
+        self.default_messages = default_messages
+        self.lock = threading.Lock()
+        self.active = False
+        self.profiles = {}      # message type -> cProfile.Profile
+        self.remaining = None   # Messages left to profile (None: no limit).
+        self.deadline = None    # time.monotonic() at which to stop (None: no limit).
+        self.timer = None       # Stops the profile at the deadline.
+
+    def start(self, messages=None, seconds=None):
+        """Profile the next messages, or for seconds (default: the next default_messages messages)."""
+        if messages is None and seconds is None:
+            messages = self.default_messages
+        timer = None
+        if seconds is not None:
+            timer = threading.Timer(seconds, lambda: self.expire(timer))
+            timer.daemon = True
+        with self.lock:
+            self.remaining = messages
+            self.deadline = time.monotonic() + seconds if seconds is not None else None
+            self.active = True
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = timer
+        if timer is not None:
+            timer.start()
+        print(f"Profiling started ({messages or 'unlimited'} messages, {seconds or 'unlimited'} seconds).")
+
+    def call(self, kind, fn, *args):
+        """Run fn(*args), under the profile for message type kind while profiling is on."""
+        if not self.active:
+            return fn(*args)
+        with self.lock:
+            profile = self.profiles.get(kind)
+            if profile is None:
+                profile = self.profiles[kind] = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args)
+        finally:
+            with self.lock:
+                if self.remaining is not None:
+                    self.remaining -= 1
+                done = ((self.remaining is not None and self.remaining <= 0)
+                        or (self.deadline is not None and time.monotonic() >= self.deadline))
+            if done:
+                self.stop()
+
+    def expire(self, timer):
+        """Called by the timer of a time-limited profile (unless a later start() replaced it)."""
+        with self.lock:
+            current = self.timer is timer
+        if current:
+            self.stop()
+
+    def stop(self):
+        """Stop profiling and write the dumps; returns the files written."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.active:
+                return []
+            self.active = False
+            profiles, self.profiles = self.profiles, {}
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        paths = []
+        for kind, profile in sorted(profiles.items()):
+            path = os.path.join(self.output_dir, f"{stamp}-{kind}.prof")
+            profile.dump_stats(path)
+            paths.append(path)
+        print(f"Profiling stopped; wrote {len(paths)} profile(s) to {self.output_dir}.")
+        return paths
@@ -0,0 +1,64 @@
+import gzip
+import json
+import threading
+import time
+
+
+class TrafficRecorder:
+    """
+    Records every decoded inbound message as one JSON line in a gzip file, for replay with
+    benchmarks/replay.py. Each record holds the wall-clock time 't', a connection id
+    'conn' (numbered in order of first message), the connection's user before the message
+    'user', and the message 'msg'. A disconnect is recorded as {'t', 'conn', 'event'}.
+    AUTH passwords are not written; replay logs in with the password in the workbook it
+    starts from, and 'auth_ok' records whether the original login succeeded.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'wt', compresslevel=6)
+        self.conn_ids = {}
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def conn_id(self, conn):
+        conn_id = self.conn_ids.get(conn)
+        if conn_id is None:
+            conn_id = self.conn_ids[conn] = self.next_id
+            self.next_id += 1
+        return conn_id
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.lock:
+            if self.file is not None:
+                self.file.write(line)
+                self.count += 1
+
+    def record_message(self, conn, username, message, auth_ok=None):
+        if message.get('type') == 'AUTH':
+            message = {key: value for key, value in message.items() if key != 'password'}
+        record = {'t': time.time(), 'conn': self.conn_id(conn), 'user': username, 'msg': message}
+        if auth_ok is not None:
+            record['auth_ok'] = auth_ok
+        self.write(record)
+
+    def record_disconnect(self, conn):
+        conn_id = self.conn_ids.pop(conn, None)
+        if conn_id is not None:
+            self.write({'t': time.time(), 'conn': conn_id, 'event': 'disconnect'})
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        print(f"Recorded {self.count} message(s) to {self.path}.")
+
+
+def read_traffic(path):
+    """Yield the records of a recording, in order."""
+    with gzip.open(path, 'rt') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,77 @@
+from collections import OrderedDict
+from capacity import SLOT_SECONDS
+from timewindows import window_contains
+
+
+def cache_slots(window):
+    """
+    The slots a window is indexed under: from the one holding its start to the one holding
+    its end. Unlike capacity.slot_range(), a zero-length window still gets a slot and a
+    window ending on a slot boundary includes that slot, so every window a seller's window
+    contains shares a slot with it.
+    """
+    return range(window[0] // SLOT_SECONDS, window[1] // SLOT_SECONDS + 1)
+
+
+class RequestCache:
+    """
+    LRU cache of BUYER_REQUEST results keyed by the normalised request
+    (window, needed_energy, duration, allow_partial).
+    A seller only appears in results for windows its own window contains, so a change to
+    a seller invalidates exactly the cached requests whose window it contains (checked
+    for both its old and new window). Entries are also indexed by 15-minute slot, so an
+    invalidation only looks at requests sharing a slot with the seller.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()    # key -> result
+        self.by_slot = {}               # slot -> set of keys whose window covers it
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Cache result for key (key[0] is the request window); evicts the least recently used entry."""
+        if self.max_entries <= 0:
+            return
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.entries[key] = result
+            return
+        self.entries[key] = result
+        for slot in cache_slots(key[0]):
+            self.by_slot.setdefault(slot, set()).add(key)
+        if len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        del self.entries[key]
+        for slot in cache_slots(key[0]):
+            keys = self.by_slot.get(slot)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_slot[slot]
+
+    def invalidate(self, seller_window):
+        """Drop every cached request whose window seller_window contains."""
+        if seller_window is None or not self.entries:
+            return
+        stale = set()
+        for slot in cache_slots(seller_window):
+            for key in self.by_slot.get(slot, ()):
+                if window_contains(seller_window, key[0]):
+                    stale.add(key)
+        for key in stale:
+            self.remove(key)
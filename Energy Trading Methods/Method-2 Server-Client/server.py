@@ -1,5 +1,10 @@
 import socket
 import threading
+import asyncio
+import argparse
+import atexit
+import signal
+import sys
 import json
 import pandas as pd
 from datetime import datetime
@@ -8,26 +13,140 @@ import time
 import numpy as np
 from datetime import datetime, timedelta
 import uuid
+import pickle
+from contextlib import contextmanager
+from storage import ExcelStorage, SQLiteStorage, GroupCommitWriter
+from orderbook import OrderBook
+from ledger import Ledger
+from auction import DayAheadBook, clear_auction
+from capacity import SlotCapacity, EPSILON
+from engine import MatchingEngine
+from outbound import ThreadedConnection, ConnectionWriter, AsyncConnection, HIGH_WATER
+from requestcache import RequestCache
+from metrics import Metrics
+from profiling import Profiler
+from recorder import TrafficRecorder
+from snapshot import SNAPSHOT_VERSION, write_snapshot, read_snapshot
+from framing import MessageDecoder, decode_frame, send_message, send_messages
+from timewindows import WindowIndex, SECONDS_PER_DAY, parse_time_of_day, window_seconds, optional_window_seconds, window_contains
+
+# Message types counted under their own metrics label; anything else is counted as 'other'.
+MESSAGE_TYPES = {'AUTH', 'AUTO_SELLER', 'AUTO_BUYER', 'BATCH', 'DAY_AHEAD_BID', 'DAY_AHEAD_ASK', 'SUBSCRIBE',
+                 'UNSUBSCRIBE', 'SELLER_REGISTER', 'SELLER_UPDATE', 'SELLER_EXIT', 'BUYER_REQUEST', 'TRANSACTION',
+                 'PROFILE'}
+
+# Orders accepted inside a BATCH message and the fields each one requires.
+BATCH_ORDER_FIELDS = {
+    'AUTO_SELLER': ['seller_id', 'seller_name', 'energy_amount', 'min_price', 'duration'],
+    'AUTO_BUYER': ['buyer_name', 'needed_energy', 'max_price', 'duration'],
+    'SELLER_REGISTER': ['seller_id', 'seller_name', 'energy_type', 'energy_amount', 'duration',
+                        'price', 'time_window']
+}
+
 class Server:
-    def __init__(self, host='192.168.166.7', port=65432, db_file='excell.xlsx'):
-        self.auto_sellers = []  # List to hold auto mode seller orders.
-        self.auto_buyers = []   # List to hold auto mode buyer orders.
+    def __init__(self, host='192.168.166.7', port=65432, db_file='excell.xlsx',
+                 storage='excel', compact_interval=60, compact_threshold=1000,
+                 durability='sync', commit_window=0.0, commit_queue_size=10000, gate_closure='12:00',
+                 outbound_high_water=HIGH_WATER, request_cache_size=1024, metrics_port=None,
+                 metrics_host='127.0.0.1', admin_users=(), profile_dir='profiles',
+                 slow_request_threshold=None, slow_request_log=None, record_traffic=None,
+                 snapshot_file=None, snapshot_interval=30):
+        self.auto_book = OrderBook()  # Auto mode seller and buyer orders (price-time priority).
         self.buyers = {}
         self.sellers = {}
         self.host = host
         self.port = port
         self.db_file = db_file
         self.clients = {}   # Maps authenticated username to connection
+        self.conn_users = {}    # Maps connection to its authenticated username
+        # Maps connection to the (kind, order_id) pairs it owns, so a disconnect only touches
+        # that connection's orders. kind is 'seller' (self.sellers), 'auto_seller' (auto
+        # mode book) or 'buyer' (self.buyers and the auto mode book).
+        self.conn_orders = {}
+        # Open connections. Each one queues what is sent to it (see outbound.py) and is
+        # disconnected once outbound_high_water bytes are waiting.
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        # Outbound running totals of the connections already closed (see connection_closed).
+        self.closed_outbound = {'coalesced_frames': 0, 'stalled_connections': 0}
+        self.outbound_high_water = outbound_high_water
+        self.connection_writer = None   # Writes for every threaded connection (see start()).
+        # Order book subscriptions: connection -> {'window', 'min_energy', 'duration', 'visible'}.
+        # Subscribers get BOOK_DELTA messages for sellers matching their filter (see publish_seller).
+        self.subscriptions = {}
+        # Recent BUYER_REQUEST results; seller_changed() drops the ones a seller change affects.
+        self.request_cache = RequestCache(request_cache_size)
+        # Counters, latency histograms and gauges (see register_metrics); served in the
+        # Prometheus text format on metrics_host:metrics_port when a port is given.
+        self.metrics = Metrics()
+        # Opt-in profiling of message handlers (SIGUSR1 or a PROFILE message from an admin user).
+        self.admin_users = set(admin_users)
+        self.profiler = Profiler(profile_dir)
+        # Requests taking at least slow_request_threshold seconds (None: off) are logged with
+        # their stage timings, as JSON lines appended to slow_request_log (or printed).
+        self.slow_request_threshold = slow_request_threshold
+        self.slow_request_log = slow_request_log
+        # Optional recording of all inbound messages to a gzip file, for benchmarks/replay.py.
+        self.recorder = TrafficRecorder(record_traffic) if record_traffic else None
+        # Order book snapshots (see snapshot_state), written every snapshot_interval seconds and
+        # on shutdown, and restored on startup. Restored orders have no connection until their
+        # owner logs in again: orphans maps username -> {(kind, order_id)} waiting to reattach.
+        self.snapshot_file = snapshot_file
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_lock = threading.Lock()
+        self.orphans = {}
         self.sellers = {}   # Maps seller_id to seller info (including connection)
+        self.seller_windows = WindowIndex()     # Containment index over seller time windows.
+        # Day-ahead call auction: orders collect per delivery slot until the daily gate
+        # closure (time of day, or None to only clear through clear_day_ahead()).
+        self.day_ahead = DayAheadBook()
+        self.gate_closure = parse_time_of_day(gate_closure) if gate_closure is not None else None
         # For now we assume only three users; we map each to a fixed sheet name.
         self.user_to_sheet = {
             "Madhav": "Sheet2",
             "Aarush": "Sheet3",
             "Tanmay": "Sheet4"
         }
+        # Persistence backend: 'excel' (workbook + append-only journal), 'sqlite'
+        # (indexed tables, with the workbook kept as an export) or a storage instance.
+        # Mutations are written through it; the workbook is only rewritten by a
+        # checkpoint (periodically, or once compact_threshold mutations are pending).
+        if storage == 'excel':
+            storage = ExcelStorage(db_file)
+        elif storage == 'sqlite':
+            storage = SQLiteStorage(os.path.splitext(db_file)[0] + '.db', export_file=db_file, import_file=db_file)
+        self.storage = storage
+        self.db_lock = threading.RLock()
+        self.checkpoint_lock = threading.Lock()     # One checkpoint at a time.
+        self.compact_interval = compact_interval
+        self.compact_threshold = compact_threshold
+        self.compact_event = threading.Event()
+        self.deferred = threading.local()   # Per-thread list of mutations awaiting one write (see deferred_writes).
+        # Mutations are written by a background group-commit thread. With durability='sync'
+        # a request waits until its commit is on disk; with 'async' it returns immediately
+        # and shutdown() guarantees the queue is flushed. commit_window=0 writes as soon as
+        # the writer is free, batching whatever queued up during the previous write.
+        if durability not in ('sync', 'async'):
+            raise ValueError("durability must be 'sync' or 'async'")
+        self.durability = durability
+        self.writer = GroupCommitWriter(self.storage, window=commit_window, max_queue=commit_queue_size,
+                                        on_write=self.check_compaction)
+        # Every message is handled on the matching engine thread, which alone touches the
+        # order book state; connection threads/tasks only decode frames and send replies.
+        self.engine = MatchingEngine()
+        self.shut_down = False
+        atexit.register(self.shutdown)
         self.load_database()
         self.ensure_columns()
-        threading.Thread(target=self.cleanup_disconnected_clients, daemon=True).start()
+        self.load_snapshot()
+        threading.Thread(target=self.compaction_loop, daemon=True).start()
+        if self.gate_closure is not None:
+            threading.Thread(target=self.day_ahead_loop, daemon=True).start()
+        if self.snapshot_file:
+            threading.Thread(target=self.snapshot_loop, daemon=True).start()
+        self.register_metrics()
+        if metrics_port is not None:
+            self.metrics.serve(metrics_host, metrics_port)
     '''def ensure_columns(self):
         """Ensure that the required columns exist in the summary DataFrame and in each transaction sheet."""
         # For the summary sheet (Sheet1)
@@ -45,23 +164,6 @@ class Server:
                 for col in required_trans_cols:
                     if col not in self.transactions[user].columns:
                         self.transactions[user][col] = np.nan'''
-    def cleanup_disconnected_clients(self):
-        """
-        Periodically check for disconnected clients and remove their orders from sellers,
-        auto_sellers, and auto_buyers.
-        """
-        while True:
-            time.sleep(30)  # Check every 30 seconds (adjust as needed)
-            active_conns = set(self.clients.values())
-            # Clean up sellers.
-            stale_seller_ids = [sid for sid, info in self.sellers.items() if info.get('conn') not in active_conns]
-            for sid in stale_seller_ids:
-                print(f"Periodic cleanup: Removing stale seller entry {sid}")
-                del self.sellers[sid]
-            # Clean up auto_sellers and auto_buyers.
-            self.auto_sellers = [order for order in self.auto_sellers if order.get('conn') in active_conns]
-            self.auto_buyers = [order for order in self.auto_buyers if order.get('conn') in active_conns]
-
     def ensure_columns(self):
         """Ensure that the required columns exist in the summary DataFrame and in each transaction sheet."""
         # For the summary sheet (Sheet1)
@@ -80,38 +182,44 @@ class Server:
         ]
         for user in self.user_to_sheet:
             if user not in self.transactions:
-                self.transactions[user] = pd.DataFrame(columns=required_trans_cols)
+                self.transactions[user] = Ledger(required_trans_cols)
             else:
                 for col in required_trans_cols:
-                    if col not in self.transactions[user].columns:
-                        self.transactions[user][col] = np.nan
+                    self.transactions[user].add_column(col)
 
 
     def load_database(self):
-        """Load the Excel file with all sheets. Sheet1 is the summary; additional sheets hold per-user transactions."""
-        if os.path.exists(self.db_file):
-            try:
-                sheets = pd.read_excel(self.db_file, sheet_name=None)
-                self.database = sheets.get('Sheet1', pd.DataFrame(columns=[
-                    'Username', 'Password', 'Registration Time', 'Seller/Buyer',
-                    'Energy Quantity (kWh)', 'Price per Unit', 'Last Transaction Time'
-                ]))
-                #self.database = pd.read_excel(self.db_file, sheet_name='Sheet1')
-
-                # For each user defined in our mapping, load (or create) a transaction sheet.
-                self.transactions = {}
-                for user, sheet_name in self.user_to_sheet.items():
-                    if sheet_name in sheets:
-                        self.transactions[user] = sheets[sheet_name]
-                    else:
-                        self.transactions[user] = pd.DataFrame(columns=[
-                            'Transaction Time', 'Seller/Buyer', 'Energy Quantity (kWh)', 'Price per Unit'
-                        ])
-            except Exception as e:
-                print("Error loading Excel file:", e)
-                self.create_empty_database()
-        else:
+        """
+        Load the summary and per-user transaction sheets from the storage backend.
+        Any journal records written after the last checkpoint are replayed on top of them.
+        """
+        database, transactions, records = self.storage.load(self.user_to_sheet)
+        if database is None:
             self.create_empty_database()
+        else:
+            self.database = database
+            self.transactions = {user: Ledger.from_frame(df) for user, df in transactions.items()}
+        self.build_user_index()
+
+        # Crash recovery: re-apply the mutations that never made it into the workbook.
+        for record in records:
+            self.apply_mutation(record)
+        if records:
+            print(f"Replayed {len(records)} journal record(s).")
+            self.save_database()
+
+    def build_user_index(self):
+        """
+        Rebuild the username -> summary row index and the username -> password map, so
+        lookups do not have to scan the Username column. If a username appears twice,
+        the first row wins (as the column scan did).
+        """
+        self.user_index = {}
+        self.credentials = {}
+        for idx, username, password in zip(self.database.index, self.database['Username'], self.database['Password']):
+            if username not in self.user_index:
+                self.user_index[username] = idx
+                self.credentials[username] = str(password)
 
     def create_empty_database(self):
         self.database = pd.DataFrame(columns=[
@@ -122,66 +230,337 @@ class Server:
 
         self.transactions = {}
         for user in self.user_to_sheet.keys():
-            self.transactions[user] = pd.DataFrame(columns=[
+            self.transactions[user] = Ledger([
                 'Transaction Time', 'Seller/Buyer', 'Energy Quantity (kWh)', 'Price per Unit'
             ])
-        self.save_database()
+        # Leave the journal alone if it still holds records to be replayed on top of this.
+        if not self.storage.pending:
+            self.save_database()
 
     def save_database(self):
-        """Save the summary and all transaction sheets to the Excel file."""
-        with pd.ExcelWriter(self.db_file) as writer:
-            self.database.to_excel(writer, sheet_name='Sheet1', index=False)
-            for user, sheet_name in self.user_to_sheet.items():
-                self.transactions[user].to_excel(writer, sheet_name=sheet_name, index=False)
+        """
+        Checkpoint the storage backend (for Excel: save all sheets and drop the journal records
+        they now contain). db_lock is only held while the state is captured; the workbook is
+        written outside it, so trading is not held up by the rewrite.
+        """
+        with self.checkpoint_lock:
+            with self.db_lock:
+                # Everything applied in memory must reach storage before the checkpoint covers it.
+                if not self.writer.closed:
+                    self.writer.flush()
+                mark = self.storage.begin_checkpoint()
+                database = self.database.copy()
+                transactions = self.transaction_frames()
+            self.storage.checkpoint(database, transactions, self.user_to_sheet, mark)
+
+    def transaction_frames(self):
+        """Materialise every user's ledger as a DataFrame for export."""
+        return {user: ledger.to_frame() for user, ledger in self.transactions.items()}
+
+    def shutdown(self, checkpoint=True):
+        """Flush queued mutations, checkpoint and close storage. Safe to call more than once."""
+        if self.shut_down:
+            return
+        self.shut_down = True
+        self.metrics.close()
+        self.profiler.stop()
+        try:
+            self.engine.stop()
+            if self.snapshot_file:
+                self.save_snapshot()
+            if self.recorder is not None:
+                self.recorder.close()
+            self.writer.close()
+            if checkpoint:
+                self.save_database()
+            self.storage.close()
+        except Exception as e:
+            print("Error during shutdown:", e)
+
+    def snapshot_state(self):
+        """
+        Engine side of save_snapshot: the live order book (manual and auto mode sellers, auto
+        mode buyers, day-ahead orders) pickled without connections. Each order records its
+        owner's username instead, so it can be reattached when they log in again.
+        """
+        copies = {}
+
+        def strip(order):
+            # Orders shared between structures (self.buyers and the auto book) stay shared.
+            copy = copies.get(id(order))
+            if copy is None:
+                copy = copies[id(order)] = {key: value for key, value in order.items() if key != 'conn'}
+                copy['owner'] = self.conn_users.get(order.get('conn'), order.get('owner'))
+            return copy
+
+        state = {
+            'version': SNAPSHOT_VERSION,
+            'time': time.time(),
+            'sellers': {sid: strip(info) for sid, info in self.sellers.items()},
+            'buyers': {bid: strip(order) for bid, order in self.buyers.items()},
+            'auto_sellers': {sid: strip(order) for sid, order in self.auto_book.sellers.items()},
+            'auto_buyers': {bid: strip(order) for bid, order in self.auto_book.buyers.items()},
+            'day_ahead': self.day_ahead.slots,
+        }
+        return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def save_snapshot(self):
+        """Write an order book snapshot, taken on the matching engine so it is consistent."""
+        data = self.snapshot_state() if self.engine.stopped else self.engine.call(self.snapshot_state)
+        with self.snapshot_lock:
+            write_snapshot(self.snapshot_file, data)
+
+    def snapshot_loop(self):
+        """Background order book snapshots."""
+        while True:
+            time.sleep(self.snapshot_interval)
+            if self.shut_down:
+                return
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                print("Error writing order book snapshot:", e)
+
+    def load_snapshot(self):
+        """Restore the order book from the last snapshot, if there is one."""
+        start = time.perf_counter()
+        state = read_snapshot(self.snapshot_file)
+        if state is None:
+            return
+
+        # 'owner' stays on the order, so the next snapshot still knows it while it is orphaned.
+        def orphan(order, kind, order_id):
+            owner = order.get('owner')
+            order['conn'] = None
+            if owner is not None:
+                self.orphans.setdefault(owner, set()).add((kind, order_id))
+
+        for sid, info in state['sellers'].items():
+            orphan(info, 'seller', sid)
+        for sid, order in state['auto_sellers'].items():
+            orphan(order, 'auto_seller', sid)
+        for bid, order in state['buyers'].items():
+            orphan(order, 'buyer', bid)
+        for order in state['auto_buyers'].values():
+            order['conn'] = None
+        self.sellers = state['sellers']
+        for sid in self.sellers:
+            self.index_seller_window(sid)
+        self.buyers = state['buyers']
+        self.auto_book.restore(state['auto_sellers'], state['auto_buyers'])
+        self.day_ahead.slots = state['day_ahead']
+        print(f"Restored {len(self.sellers)} seller(s), {len(self.auto_book)} auto mode order(s) and "
+              f"{len(self.day_ahead)} day-ahead order(s) from the snapshot taken at "
+              f"{datetime.fromtimestamp(state['time']).isoformat()} in {(time.perf_counter() - start) * 1000:.1f} ms.")
+
+    def reattach_orders(self, username, conn):
+        """Give a user's restored orders their new connection; returns how many were reattached."""
+        reattached = set()
+        for kind, order_id in self.orphans.pop(username, ()):
+            if kind == 'seller':
+                order = self.sellers.get(order_id)
+            elif kind == 'auto_seller':
+                order = self.auto_book.sellers.get(order_id)
+            else:
+                order = self.buyers.get(order_id)
+            # Skip orders that were filled, or replaced by a new one, since the restart.
+            if order is not None and order.get('conn') is None:
+                order['conn'] = conn
+                self.track_order(conn, kind, order_id)
+                # An auto mode seller is both on the book and in self.sellers; count it once.
+                reattached.add(order_id)
+        if reattached:
+            print(f"Reattached {len(reattached)} restored order(s) to '{username}'.")
+        return len(reattached)
+
+    def compaction_loop(self):
+        """Background checkpointing of pending mutations."""
+        while True:
+            self.compact_event.wait(self.compact_interval)
+            self.compact_event.clear()
+            if self.storage.pending:
+                try:
+                    self.save_database()
+                except Exception as e:
+                    print("Error checkpointing database:", e)
+
+    def persist(self, mutations):
+        """
+        Apply mutations to the in-memory sheets and write them to the storage backend.
+        This replaces a full workbook save per event with one journal append or SQLite transaction.
+        """
+        with self.stage_timer('persist'), self.db_lock:
+            for mutation in mutations:
+                self.apply_mutation(mutation)
+            pending = getattr(self.deferred, 'mutations', None)
+            if pending is not None:
+                pending.extend(mutations)
+                return
+            ticket = self.writer.submit(mutations)
+        self.wait_durable(ticket)
+
+    def wait_durable(self, ticket):
+        """
+        With durability='sync', wait until the commit is on disk. Inside an engine command the
+        ticket is handed back to the connection instead (see run_command), so the engine moves
+        on to the next command and the reply is only sent once the write completed.
+        """
+        if self.durability != 'sync':
+            return
+        tickets = getattr(self.deferred, 'tickets', None)
+        if tickets is not None:
+            tickets.append(ticket)
+        else:
+            # Wait outside the lock so concurrent requests can share one commit.
+            with self.stage_timer('commit_wait'):
+                ticket.wait()
+
+    def run_command(self, fn, *args):
+        """Engine-side wrapper: run fn and return (result, commit tickets it produced)."""
+        self.deferred.tickets = []
+        try:
+            result = fn(*args)
+        finally:
+            tickets, self.deferred.tickets = self.deferred.tickets, None
+        return result, tickets
+
+    def execute(self, fn, *args):
+        """Run fn(*args) on the matching engine and wait for its result and its commits."""
+        if self.engine.in_engine_thread():
+            return fn(*args)
+        result, tickets = self.engine.submit(self.run_command, fn, *args).result()
+        if tickets:
+            with self.stage_timer('commit_wait'):
+                wait_tickets(tickets)
+        return result
+
+    async def execute_async(self, fn, *args):
+        """asyncio counterpart of execute(): the event loop keeps serving other connections."""
+        result, tickets = await asyncio.wrap_future(self.engine.submit(self.run_command, fn, *args))
+        if tickets:
+            start = time.perf_counter()
+            await asyncio.get_running_loop().run_in_executor(None, wait_tickets, tickets)
+            self.record_stage('commit_wait', time.perf_counter() - start)
+        return result
+
+    def check_compaction(self):
+        """Called by the writer after each commit; wakes the compaction thread when enough is pending."""
+        if self.storage.pending >= self.compact_threshold:
+            self.compact_event.set()
+
+    @contextmanager
+    def deferred_writes(self):
+        """
+        Collect every mutation persisted by this thread inside the block and write them to
+        storage together on exit (used by BATCH). In-memory state is still updated immediately.
+        db_lock is held for the whole block, so a checkpoint cannot capture the in-memory
+        changes before their mutations are queued (they would then be replayed twice).
+        """
+        ticket = None
+        with self.db_lock:
+            self.deferred.mutations = []
+            try:
+                yield
+            finally:
+                mutations, self.deferred.mutations = self.deferred.mutations, None
+                if mutations:
+                    with self.stage_timer('persist'):
+                        ticket = self.writer.submit(mutations)
+        if ticket is not None:
+            self.wait_durable(ticket)
+
+    def apply_mutation(self, mutation):
+        """
+        Apply one mutation to the in-memory DataFrames. Three kinds exist:
+        {'op': 'new_user', 'username', 'fields'} adds a summary row,
+        {'op': 'user', 'username', 'fields'} sets summary columns (None clears a cell), and
+        {'op': 'transaction', 'username', 'record'} appends a row to the user's transaction sheet.
+        """
+        username = mutation['username']
+        if mutation['op'] == 'new_user':
+            if username in self.user_index:
+                return
+            idx = self.database.index.max() + 1 if len(self.database) else 0
+            row = {col: np.nan for col in self.database.columns}
+            row.update({col: np.nan if value is None else value for col, value in mutation['fields'].items()})
+            row['Username'] = username
+            self.database.loc[idx] = row
+            self.user_index[username] = idx
+            self.credentials[username] = str(row['Password'])
+        elif mutation['op'] == 'user':
+            idx = self.user_index.get(username)
+            if idx is None:
+                return
+            for col, value in mutation['fields'].items():
+                self.database.at[idx, col] = np.nan if value is None else value
+            if 'Password' in mutation['fields']:
+                self.credentials[username] = str(mutation['fields']['Password'])
+        elif mutation['op'] == 'transaction':
+            if username not in self.transactions:
+                # If a new user appears, create a new transaction ledger for them.
+                self.transactions[username] = Ledger([
+                    'Transaction Time', 'Seller/Buyer', 'Energy Quantity (kWh)', 'Price per Unit'
+                ])
+            record = dict(mutation['record'])
+            # Keep "Transaction Time" as a string, as the sheet stores it.
+            record['Transaction Time'] = str(record['Transaction Time'])
+            # Appends into a preallocated chunk; the DataFrame is only built on export.
+            self.transactions[username].append(record)
 
     def authenticate_user(self, username, password):
         """
         Check if the provided username and password match any record in the summary sheet.
         If the user does not exist yet, add them.
         """
-        if username not in self.database['Username'].values:
+        if username not in self.credentials:
             print("User not found ,exiting")
             return False
         else:
             # Existing user: check the password.
-            record = self.database[self.database['Username'] == username]
-            if not record.empty and str(record.iloc[0]['Password']) == str(password):
+            if self.credentials[username] == str(password):
                 # Optionally update the registration time on login.
-                idx = self.database[self.database['Username'] == username].index[0]
-                self.database.at[idx, 'Registration Time'] = datetime.now().isoformat()
-                self.save_database()
+                self.persist([{'op': 'user', 'username': username,
+                               'fields': {'Registration Time': datetime.now().isoformat()}}])
                 return True
             return False
 
+    def add_user(self, username, password):
+        """Add a new user to the summary sheet. Returns False if the username is taken."""
+        if username in self.user_index:
+            return False
+        self.persist([{'op': 'new_user', 'username': username, 'fields': {
+            'Password': str(password),
+            'Registration Time': datetime.now().isoformat()
+        }}])
+        return True
+
     def update_user_info(self, username, role, energy_quantity, price_per_unit):
         """Update the summary sheet for the given user (used when a seller registers)."""
-        try:
-            idx = self.database[self.database['Username'] == username].index[0]
-        except IndexError:
+        idx = self.user_index.get(username)
+        if idx is None:
             print(f"Username {username} not found in database; skipping update.")
             return
-        self.database.at[idx, 'Seller/Buyer'] = role
-        self.database.at[idx, 'Energy Quantity (kWh)'] = energy_quantity
-        self.database.at[idx, 'Price per Unit'] = price_per_unit
         # Update registration time as well.
-        
-        self.database.at[idx, 'Registration Time'] = datetime.now().isoformat()
+        self.persist([{'op': 'user', 'username': username, 'fields': {
+            'Seller/Buyer': role,
+            'Energy Quantity (kWh)': energy_quantity,
+            'Price per Unit': price_per_unit,
+            'Registration Time': datetime.now().isoformat()
+        }}])
         print(datetime.now())
         print(f"Price per unit at index {idx}: {self.database.at[idx, 'Price per Unit']}")
-        self.save_database()
 
     def remove_user_info(self, username):
         """Clear seller-specific info from the user's record in the summary sheet."""
-        try:
-            idx = self.database[self.database['Username'] == username].index[0]
-        except IndexError:
+        if username not in self.user_index:
             print(f"Username {username} not found in database; skipping removal.")
             return
-        self.database.at[idx, 'Seller/Buyer'] = np.nan
-        self.database.at[idx, 'Energy Quantity (kWh)'] = np.nan
-        self.database.at[idx, 'Price per Unit'] = np.nan
-        self.database.at[idx, 'Registration Time'] = np.nan
-        self.save_database()
+        self.persist([{'op': 'user', 'username': username, 'fields': {
+            'Seller/Buyer': None,
+            'Energy Quantity (kWh)': None,
+            'Price per Unit': None,
+            'Registration Time': None
+        }}])
 
     def update_transaction(self, username, transaction_type, energy_quantity, price_per_unit):
         """
@@ -194,221 +573,740 @@ class Server:
             'Energy Quantity (kWh)': energy_quantity,
             'Price per Unit': price_per_unit
         }
-        # Append the new transaction to the appropriate transaction sheet.
-        if username not in self.transactions:
-            # If a new user appears, create a new transaction DataFrame for them.
-            self.transactions[username] = pd.DataFrame(columns=[
-                'Transaction Time', 'Seller/Buyer', 'Energy Quantity (kWh)', 'Price per Unit'
-            ])
-        new_transaction_df = pd.DataFrame([new_transaction])
-        # Ensure the "Transaction Time" column is of type string in both DataFrames.
-        new_transaction_df['Transaction Time'] = new_transaction_df['Transaction Time'].astype(str)
-        self.transactions[username]['Transaction Time'] = self.transactions[username]['Transaction Time'].astype(str)
-        
-        self.transactions[username] = pd.concat([self.transactions[username], new_transaction_df], ignore_index=True)
-        
-        # Update the summary sheet with the last transaction time.
-        if username in self.database['Username'].values:
-            idx = self.database[self.database['Username'] == username].index[0]
-            self.database.at[idx, 'Last Transaction Time'] = datetime.now().isoformat()
-        
-        self.save_database()
-
-
-    def handle_client(self, conn, addr):
+        # Append the new transaction to the appropriate transaction sheet and update the
+        # summary sheet with the last transaction time (skipped for unknown users).
+        self.persist([
+            {'op': 'transaction', 'username': username, 'record': new_transaction},
+            {'op': 'user', 'username': username,
+             'fields': {'Last Transaction Time': datetime.now().isoformat()}}
+        ])
+
+
+    def handle_client(self, sock, addr):
         print(f"Connected by {addr}")
+        conn = ThreadedConnection(sock, self.connection_writer, self.outbound_high_water)
+        with self.connections_lock:
+            self.connections.add(conn)
         username = None  # Will be set upon successful authentication
+        decoder = MessageDecoder(legacy=True)
         try:
             while True:
-                data = conn.recv(1024).decode()
+                data = conn.recv(65536)
                 if not data:
                     break
-                try:
-                    message = json.loads(data)
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error from {addr}: {e}")
-                    conn.sendall(json.dumps({'status': 'invalid_format'}).encode())
-                    continue
-
-                # Handle authentication.
-                if message['type'] == 'AUTH':
-                    username = message['username']
-                    if self.authenticate_user(username, message['password']):
-                        self.clients[username] = conn
-                        response = {'status': 'AUTH_SUCCESS'}
-                        print(f"User '{username}' authenticated.")
-                    else:
-                        response = {'status': 'AUTH_FAILED'}
-                        print(f"Authentication failed for user '{username}'.")
-                    conn.sendall(json.dumps(response).encode())
-                else:
-                    # For other messages, ensure the client is authenticated.
-                    if username is None:
-                        conn.sendall(json.dumps({'status': 'error', 'message': 'Not authenticated'}).encode())
-                        continue
-                    response = self.process_message(message, username)
-                    conn.sendall(json.dumps(response).encode())
+                responses, username = self.handle_frames(decoder.feed(data), username, conn, addr)
+                if responses:
+                    with self.stage_timer('reply'):
+                        send_messages(conn, responses)
         except Exception as e:
             print(f"Error handling client {addr}: {e}")
         finally:
             conn.close()
-            if username:
-                # Remove this user from the client mapping and clean up stale orders.
-                if username in self.clients:
-                    del self.clients[username]
-                self.remove_user_from_all_lists(username)
+            self.connection_closed(conn)
+            if not self.engine.stopped:
+                self.execute(self.client_disconnected, username, conn)
             print(f"Connection closed for {addr}.")
-    def remove_user_from_all_lists(self, username):
-        # Remove from sellers as before.
-        stale_seller_ids = [sid for sid, info in self.sellers.items() if info.get('conn') not in self.clients.values()]
-        for sid in stale_seller_ids:
-            print(f"Removing stale seller entry: {sid}")
-            del self.sellers[sid]
-
-        # Remove auto mode orders associated with the user.
-        self.auto_sellers = [order for order in self.auto_sellers if order.get('conn') in self.clients.values()]
-        self.auto_buyers = [order for order in self.auto_buyers if order.get('conn') in self.clients.values()]
-
-        # Also remove stale auto buyer entries from the global buyers dictionary.
-        stale_buyer_ids = [bid for bid, order in self.buyers.items() if order.get('conn') not in self.clients.values()]
-        for bid in stale_buyer_ids:
-            print(f"Removing stale buyer entry: {bid}")
-            del self.buyers[bid]
-
-
-    def attempt_auto_match(self):
-        # Loop through a copy of the buyer orders (so that we can remove orders when matched)
-        for buyer in self.auto_buyers[:]:
-            for seller in self.auto_sellers[:]:
-                if seller['energy_amount'] >= buyer['needed_energy'] and seller['min_price'] <= buyer['max_price']:
-                    # Match found!
-                    transaction_energy = buyer['needed_energy']
-                    # Reduce seller's available energy
-                    seller['energy_amount'] -= transaction_energy
-                    # Remove seller order if completely filled:
-                    if seller['energy_amount'] <= 0:
-                        self.auto_sellers.remove(seller)
-                    self.auto_buyers.remove(buyer)
-                    # Update transactions in your Excel/logging system:
-                    #self.update_transaction(buyer['buyer_name'], f"Bought {transaction_energy} kWh from auto seller {seller['seller_name']}.", transaction_energy, seller['min_price'])
-                    #self.update_transaction(seller['seller_name'], f"Sold {transaction_energy} kWh to auto buyer {buyer['buyer_name']}.", transaction_energy, seller['min_price'])
-                    self.update_transaction(buyer['buyer_name'], 'Buyer', transaction_energy, seller['min_price'])
-                    self.update_transaction(seller['seller_name'], 'Seller', transaction_energy, seller['min_price'])
-                    print(f"Auto-match: Buyer '{buyer['buyer_name']}' purchased {transaction_energy} kWh from seller '{seller['seller_name']}'.")
-                    # Send notifications (similar to your TRANSACTION_NOTIFICATION)
-                    notification = {
-                        'type': 'TRANSACTION_NOTIFICATION',
-                        'buyer_name': buyer['buyer_name'],
-                        'energy_amount': transaction_energy,
-                        'duration': seller['duration'],  # or buyer['duration'], as appropriate
-                        'price': seller['min_price'],
-                        'automode': True
-                    }
-                    # Notify seller:
-                    try:
-                        if seller['conn']:
-                            seller['conn'].sendall(json.dumps(notification).encode())
-                    except Exception as e:
-                        print("Error sending auto transaction notification to seller:", e)
-                    # Notify buyer:
-                    try:
-                        if buyer['conn']:
-                            buyer['conn'].sendall(json.dumps(notification).encode())
-                    except Exception as e:
-                        print("Error sending auto transaction notification to buyer:", e)
-                    # Break out to move to the next buyer.
+
+    async def handle_client_async(self, reader, writer):
+        """asyncio counterpart of handle_client: one lightweight task per connection."""
+        addr = writer.get_extra_info('peername')
+        conn = AsyncConnection(writer, asyncio.get_running_loop(), self.outbound_high_water)
+        with self.connections_lock:
+            self.connections.add(conn)
+        username = None  # Will be set upon successful authentication
+        decoder = MessageDecoder(legacy=True)
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
                     break
+                received = time.perf_counter()
+                messages = self.decode_frames(decoder.feed(data), addr)
+                if not messages:
+                    continue
+                # Matching runs on the engine thread; the loop keeps serving other connections meanwhile.
+                responses, username = await self.execute_async(self.handle_messages, messages, username, conn, received)
+                with self.stage_timer('reply'):
+                    send_messages(conn, responses)
+        except Exception as e:
+            print(f"Error handling client {addr}: {e}")
+        finally:
+            conn.close()
+            self.connection_closed(conn)
+            if not self.engine.stopped:
+                await self.execute_async(self.client_disconnected, username, conn)
+
+    def handle_frames(self, frames, username, conn, addr):
+        """
+        Handle every complete frame read from a connection, in order. Frames are decoded on
+        the calling thread and handled together as one matching engine command. Pipelined
+        requests are answered together: returns (responses, username) so the caller can send
+        all the responses with one write.
+        """
+        received = time.perf_counter()
+        messages = self.decode_frames(frames, addr)
+        if not messages:
+            return [], username
+        return self.execute(self.handle_messages, messages, username, conn, received)
+
+    @contextmanager
+    def stage_timer(self, stage):
+        """Time the with block as one processing stage (see record_stage)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start)
+
+    def record_stage(self, stage, seconds):
+        """Add to the stage histogram and to the stage timings of the request being handled, if traced."""
+        self.metrics.observe('p2p_stage_seconds', seconds, stage=stage)
+        stages = getattr(self.deferred, 'stages', None)
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def log_slow_request(self, kind, username, total, handled, stages):
+        """Record a request that took at least slow_request_threshold seconds."""
+        entry = {
+            'time': datetime.now().isoformat(),
+            'type': kind,
+            'username': username,
+            'total_ms': round(total * 1000, 3),
+            'handler_ms': round(handled * 1000, 3),
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()}
+        }
+        if self.slow_request_log is None:
+            print("Slow request:", entry)
+            return
+        try:
+            with open(self.slow_request_log, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError as e:
+            print("Error writing slow request log:", e)
+
+    def register_metrics(self):
+        """Describe the recorded metrics and register the gauges read at scrape time."""
+        metrics = self.metrics
+        metrics.describe('p2p_messages_total', 'counter', "Messages handled, by type.")
+        metrics.describe('p2p_message_errors_total', 'counter', "Messages answered with an error or failure status, by type.")
+        metrics.describe('p2p_message_seconds', 'histogram', "Time handling one message on the matching engine, by type.")
+        metrics.describe('p2p_stage_seconds', 'histogram',
+                         "Time per stage: parse (decode frames), match (auto mode book), persist (apply and "
+                         "queue mutations), commit_wait (wait for durable commits), notify (push to counterparties), "
+                         "reply (queue responses).")
+        metrics.describe('p2p_notifications_total', 'counter', "Pushed messages, by type.")
+        metrics.describe('p2p_auto_fills_total', 'counter', "Auto mode fills.")
+        metrics.describe('p2p_malformed_frames_total', 'counter', "Frames that were not valid JSON.")
+        metrics.gauge('p2p_sellers', lambda: len(self.sellers), "Sellers visible to buyer requests.")
+        metrics.gauge('p2p_buyers', lambda: len(self.buyers), "Auto mode buyers waiting on the book.")
+        metrics.gauge('p2p_auto_book_orders', lambda: len(self.auto_book), "Orders resting on the auto mode book.")
+        metrics.gauge('p2p_day_ahead_orders', lambda: len(self.day_ahead), "Day-ahead orders awaiting gate closure.")
+        metrics.gauge('p2p_authenticated_clients', lambda: len(self.clients), "Logged in users.")
+        metrics.gauge('p2p_subscriptions', lambda: len(self.subscriptions), "Order book subscriptions.")
+        metrics.gauge('p2p_engine_queue_depth', lambda: self.engine.commands.qsize(), "Commands waiting for the matching engine.")
+        metrics.gauge('p2p_storage_pending', lambda: self.storage.pending, "Mutations written since the last checkpoint.")
+        for name, kind, stat, help_text in [
+            ('p2p_outbound_connections', 'gauge', 'connections', "Open connections."),
+            ('p2p_outbound_queued_frames', 'gauge', 'queued_frames', "Frames queued over all connections."),
+            ('p2p_outbound_queued_bytes', 'gauge', 'queued_bytes', "Bytes queued over all connections."),
+            ('p2p_outbound_max_queue_depth', 'gauge', 'max_queue_depth', "Deepest outbound queue right now."),
+            ('p2p_outbound_peak_queue_depth', 'gauge', 'peak_queue_depth',
+             "Deepest an open connection's queue has been."),
+            ('p2p_outbound_peak_queued_bytes', 'gauge', 'peak_queued_bytes',
+             "Most bytes an open connection has had queued."),
+            ('p2p_outbound_coalesced_frames_total', 'counter', 'coalesced_frames',
+             "Queued frames replaced by a newer frame with the same coalesce key."),
+            ('p2p_outbound_stalled_connections_total', 'counter', 'stalled_connections',
+             "Connections dropped for exceeding the outbound high-water mark."),
+        ]:
+            metrics.gauge(name, lambda stat=stat: self.outbound_stats()[stat], help_text, kind)
+        metrics.gauge('p2p_request_cache_entries', lambda: len(self.request_cache), "Cached BUYER_REQUEST results.")
+        metrics.gauge('p2p_request_cache_hits_total', lambda: self.request_cache.hits,
+                      "BUYER_REQUESTs answered from the cache.", 'counter')
+        metrics.gauge('p2p_request_cache_misses_total', lambda: self.request_cache.misses,
+                      "BUYER_REQUESTs not found in the cache.", 'counter')
+
+    def connection_closed(self, conn):
+        """Forget a closed connection, keeping its outbound totals for the metrics."""
+        with self.connections_lock:
+            self.connections.discard(conn)
+            self.closed_outbound['coalesced_frames'] += conn.coalesced
+            self.closed_outbound['stalled_connections'] += conn.overflowed
+
+    def outbound_stats(self):
+        """
+        Queue depth metrics over the open connections' outbound queues, and running totals
+        (coalesced_frames, stalled_connections) over every connection so far.
+        """
+        with self.connections_lock:
+            connections = list(self.connections)
+            closed = dict(self.closed_outbound)
+        return {
+            'connections': len(connections),
+            'queued_frames': sum(conn.depth for conn in connections),
+            'queued_bytes': sum(conn.queued_bytes for conn in connections),
+            'max_queue_depth': max((conn.depth for conn in connections), default=0),
+            'peak_queue_depth': max((conn.max_depth for conn in connections), default=0),
+            'peak_queued_bytes': max((conn.max_bytes for conn in connections), default=0),
+            'coalesced_frames': closed['coalesced_frames'] + sum(conn.coalesced for conn in connections),
+            'stalled_connections': closed['stalled_connections'] + sum(conn.overflowed for conn in connections)
+        }
+
+    def decode_frames(self, frames, addr):
+        """Decode raw frames; a malformed frame becomes None so it is answered in order."""
+        messages = []
+        start = time.perf_counter()
+        for frame in frames:
+            try:
+                messages.append(decode_frame(frame))
+            except json.JSONDecodeError as e:
+                print(f"JSON decode error from {addr}: {e}")
+                self.metrics.inc('p2p_malformed_frames_total')
+                messages.append(None)
+        if frames:
+            self.record_stage('parse', time.perf_counter() - start)
+        return messages
+
+    def handle_messages(self, messages, username, conn, received=None):
+        """
+        Engine side of handle_frames: returns (responses, username). received is the
+        perf_counter() time the frames were read; with the slow request log on, a request's
+        total time counts from then (parsing and waiting for the engine included).
+        """
+        responses = []
+        for message in messages:
+            if message is None:
+                responses.append({'status': 'invalid_format'})
+                continue
+            kind = message.get('type') if isinstance(message, dict) else None
+            kind = kind if kind in MESSAGE_TYPES else 'other'
+            previous_username = username
+            start = time.perf_counter()
+            if self.slow_request_threshold is not None:
+                self.deferred.stages = {}
+            try:
+                response, username = self.profiler.call(kind, self.handle_message, message, username, conn)
+            finally:
+                stages, self.deferred.stages = getattr(self.deferred, 'stages', None), None
+            end = time.perf_counter()
+            self.metrics.observe('p2p_message_seconds', end - start, type=kind)
+            if self.recorder is not None:
+                auth_ok = response.get('status') == 'AUTH_SUCCESS' if kind == 'AUTH' else None
+                self.recorder.record_message(conn, previous_username, message, auth_ok)
+            if stages is not None:
+                total = end - (received if received is not None else start)
+                if total >= self.slow_request_threshold:
+                    stages['queue'] = start - received if received is not None else 0.0
+                    self.log_slow_request(kind, username, total, end - start, stages)
+            self.metrics.inc('p2p_messages_total', type=kind)
+            if isinstance(response, dict) and response.get('status') in ('error', 'AUTH_FAILED', 'transaction_failed'):
+                self.metrics.inc('p2p_message_errors_total', type=kind)
+            responses.append(response)
+        return responses, username
+
+    def handle_message(self, message, username, conn):
+        """
+        Handle one decoded message received on conn. Returns (response, username), where
+        username is the connection's authenticated user after this message (or None).
+        """
+        # Handle authentication.
+        if message['type'] == 'AUTH':
+            if self.authenticate_user(message['username'], message['password']):
+                username = message['username']
+                self.clients[username] = conn
+                self.conn_users[conn] = username
+                response = {'status': 'AUTH_SUCCESS'}
+                restored = self.reattach_orders(username, conn)
+                if restored:
+                    response['restored_orders'] = restored
+                print(f"User '{username}' authenticated.")
+            else:
+                response = {'status': 'AUTH_FAILED'}
+                print(f"Authentication failed for user '{message['username']}'.")
+            return response, username
+        # For other messages, ensure the client is authenticated.
+        if username is None:
+            return {'status': 'error', 'message': 'Not authenticated'}, username
+        return self.process_message(message, username), username
+
+    def client_disconnected(self, username, conn):
+        """Remove this connection from the client mapping and drop the orders it owned."""
+        # The user may already be logged in again on a newer connection; keep that one.
+        if username and self.clients.get(username) is conn:
+            del self.clients[username]
+        self.conn_users.pop(conn, None)
+        self.subscriptions.pop(conn, None)
+        self.remove_connection_orders(conn)
+        if self.recorder is not None:
+            self.recorder.record_disconnect(conn)
+
+    def track_order(self, conn, kind, order_id):
+        """Record that conn owns an order, for cleanup when it disconnects."""
+        if conn is not None:
+            self.conn_orders.setdefault(conn, set()).add((kind, order_id))
+
+    def untrack_order(self, conn, kind, order_id):
+        owned = self.conn_orders.get(conn)
+        if owned is not None:
+            owned.discard((kind, order_id))
+
+    def add_seller(self, seller_id, info):
+        """Add (or replace) a seller entry and index its time window."""
+        old = self.sellers.get(seller_id)
+        if old is not None:
+            self.untrack_order(old.get('conn'), 'seller', seller_id)
+        self.sellers[seller_id] = info
+        self.track_order(info.get('conn'), 'seller', seller_id)
+        self.index_seller_window(seller_id)
+        self.seller_changed(seller_id, old.get('window') if old is not None else None)
+
+    def remove_seller(self, seller_id):
+        """Remove a seller entry and its time window from the index."""
+        info = self.sellers.pop(seller_id, None)
+        if info is not None:
+            self.untrack_order(info.get('conn'), 'seller', seller_id)
+        self.seller_windows.remove(seller_id)
+        self.seller_changed(seller_id, info.get('window') if info is not None else None)
+
+    def available_energy(self, seller_id, window):
+        """
+        Energy the seller can still supply over window. Sellers with a slot capacity answer per
+        15-minute slot; others (auto mode mirrors) only have their scalar energy_amount.
+        """
+        info = self.sellers[seller_id]
+        capacity = info.get('capacity')
+        if capacity is None or window is None:
+            return info['energy_amount']
+        return capacity.available(window)
+
+    def reserve_energy(self, seller_id, window, energy):
+        """Take energy from the seller over window (the caller checked available_energy)."""
+        info = self.sellers[seller_id]
+        capacity = info.get('capacity')
+        if capacity is None or window is None:
+            info['energy_amount'] -= energy
+        else:
+            capacity.reserve(window, energy)
+            # energy_amount now shows what the seller can still supply over its window.
+            info['energy_amount'] = capacity.remaining()
+        self.seller_changed(seller_id)
+
+    def seller_view(self, seller_id, energy_amount):
+        """The seller fields sent to buyers, with energy_amount as available to them."""
+        info = self.sellers[seller_id]
+        return {
+            'seller_id': seller_id,
+            'seller_name': info['seller_name'],
+            'energy_type': info['energy_type'],
+            'energy_amount': energy_amount,
+            'duration': info['duration'],
+            'price': info['price'],
+            'time_window': info.get('time_window', {})
+        }
+
+    def subscribe(self, conn, window, min_energy, duration):
+        """
+        Subscribe conn to sellers whose window contains window (for at least duration seconds)
+        and that can supply at least min_energy over it. The current matches are pushed as a
+        BOOK_SNAPSHOT; later changes arrive as BOOK_DELTA messages. Returns the snapshot size.
+        """
+        subscription = {'window': window, 'min_energy': min_energy, 'duration': duration, 'visible': set()}
+        sellers = []
+        if window[1] - window[0] >= duration:
+            for sid in self.seller_windows.query(window[0], window[1]):
+                energy_amount = self.available_energy(sid, window)
+                if energy_amount + EPSILON >= min_energy and energy_amount > 0:
+                    sellers.append(self.seller_view(sid, energy_amount))
+                    subscription['visible'].add(sid)
+        self.subscriptions[conn] = subscription
+        # Pushed (rather than returned) so it is queued ahead of any delta that follows.
+        self.notify(conn, {'type': 'BOOK_SNAPSHOT', 'sellers': sellers})
+        return len(sellers)
+
+    def notify(self, conn, message, coalesce_key=None):
+        """Push a message the client did not ask for (notification, book update), counted per type."""
+        with self.stage_timer('notify'):
+            send_message(conn, message, coalesce_key)
+        self.metrics.inc('p2p_notifications_total', type=message['type'])
+
+    def seller_changed(self, seller_id, old_window=None):
+        """
+        Called after any change to a seller entry (added, updated, traded, removed): drops the
+        cached BUYER_REQUEST results it affects and pushes the change to subscribers.
+        old_window is the seller's window before the change, if it may have moved.
+        """
+        info = self.sellers.get(seller_id)
+        self.request_cache.invalidate(old_window)
+        if info is not None and info.get('window') != old_window:
+            self.request_cache.invalidate(info.get('window'))
+        self.publish_seller(seller_id)
+
+    def publish_seller(self, seller_id):
+        """
+        Push the change of one seller to every subscriber it concerns: 'add' when it starts
+        matching their filter, 'update' while it keeps matching, 'remove' when it stops.
+        Deltas for one seller coalesce in a slow subscriber's outbound queue.
+        """
+        if not self.subscriptions:
+            return
+        info = self.sellers.get(seller_id)
+        for conn, subscription in list(self.subscriptions.items()):
+            window = subscription['window']
+            energy_amount = None
+            if info is not None and info.get('window') and window_contains(info['window'], window, subscription['duration']):
+                energy_amount = self.available_energy(seller_id, window)
+                if energy_amount + EPSILON < subscription['min_energy'] or energy_amount <= 0:
+                    energy_amount = None
+            if energy_amount is not None:
+                action = 'update' if seller_id in subscription['visible'] else 'add'
+                subscription['visible'].add(seller_id)
+                delta = {'type': 'BOOK_DELTA', 'action': action, 'seller': self.seller_view(seller_id, energy_amount)}
+            elif seller_id in subscription['visible']:
+                subscription['visible'].discard(seller_id)
+                delta = {'type': 'BOOK_DELTA', 'action': 'remove', 'seller_id': seller_id}
+            else:
+                continue
+            try:
+                self.notify(conn, delta, coalesce_key=('book', seller_id))
+            except Exception as e:
+                print("Error sending order book update:", e)
+                self.subscriptions.pop(conn, None)
+
+    def index_seller_window(self, seller_id):
+        """
+        (Re)index a seller's time window, as pre-parsed into info['window'] on ingest.
+        Sellers without a valid window are left out of the index, so they never match a buyer request.
+        """
+        window = self.sellers[seller_id].get('window')
+        if window is None:
+            self.seller_windows.remove(seller_id)
+        else:
+            self.seller_windows.add(seller_id, window[0], window[1])
+
+    def remove_connection_orders(self, conn):
+        """Remove every seller, auto mode and buyer order owned by a closed connection."""
+        for kind, order_id in self.conn_orders.pop(conn, ()):
+            if kind == 'seller':
+                info = self.sellers.get(order_id)
+                if info is not None and info.get('conn') is conn:
+                    print(f"Removing stale seller entry: {order_id}")
+                    self.remove_seller(order_id)
+            elif kind == 'auto_seller':
+                order = self.auto_book.sellers.get(order_id)
+                if order is not None and order.get('conn') is conn:
+                    self.auto_book.remove_seller(order_id)
+            else:
+                order = self.buyers.get(order_id)
+                if order is not None and order.get('conn') is conn:
+                    print(f"Removing stale buyer entry: {order_id}")
+                    del self.buyers[order_id]
+                    self.auto_book.remove_buyer(order_id)
+
+
+    def attempt_auto_match(self, order):
+        """
+        Add a new auto mode order to the book, matching only it against the opposite side,
+        then record and notify every resulting fill.
+        """
+        with self.stage_timer('match'):
+            if 'seller_id' in order:
+                fills = self.auto_book.add_seller(order)
+            else:
+                fills = self.auto_book.add_buyer(order)
+        self.metrics.inc('p2p_auto_fills_total', len(fills))
+        self.settle_auto_fills(fills)
+
+    def settle_auto_fills(self, fills):
+        """Record transactions for auto mode fills and notify both sides."""
+        for fill in fills:
+            buyer, seller = fill['buyer'], fill['seller']
+            transaction_energy = fill['energy_amount']
+            # Once the buyer order is complete, drop it from the global buyers dictionary too.
+            if buyer['needed_energy'] <= 0:
+                self.buyers.pop(buyer['buyer_id'], None)
+                self.untrack_order(buyer['conn'], 'buyer', buyer['buyer_id'])
+            if seller['energy_amount'] <= 0:
+                self.untrack_order(seller['conn'], 'auto_seller', seller['seller_id'])
+            # Keep the seller entry buyers can see in sync with what is left on the book.
+            mirror = self.sellers.get(seller['seller_id'])
+            if mirror is not None and mirror.get('energy_type') == "AUTO":
+                if seller['energy_amount'] > 0:
+                    mirror['energy_amount'] = seller['energy_amount']
+                    self.seller_changed(seller['seller_id'])
+                else:
+                    self.remove_seller(seller['seller_id'])
+            # Update transactions in your Excel/logging system:
+            self.update_transaction(buyer['buyer_name'], 'Buyer', transaction_energy, fill['price'])
+            self.update_transaction(seller['seller_name'], 'Seller', transaction_energy, fill['price'])
+            print(f"Auto-match: Buyer '{buyer['buyer_name']}' purchased {transaction_energy} kWh from seller '{seller['seller_name']}'.")
+            # Send notifications (similar to your TRANSACTION_NOTIFICATION)
+            notification = {
+                'type': 'TRANSACTION_NOTIFICATION',
+                'buyer_name': buyer['buyer_name'],
+                'energy_amount': transaction_energy,
+                'duration': seller['duration'],  # or buyer['duration'], as appropriate
+                'price': fill['price'],
+                'remaining_energy': fill['remaining_energy'],
+                'automode': True
+            }
+            # Notify seller:
+            try:
+                if seller['conn']:
+                    self.notify(seller['conn'], notification)
+            except Exception as e:
+                print("Error sending auto transaction notification to seller:", e)
+            # Notify buyer:
+            try:
+                if buyer['conn']:
+                    self.notify(buyer['conn'], notification)
+            except Exception as e:
+                print("Error sending auto transaction notification to buyer:", e)
+
+    def register_auto_seller(self, message, username, match=True):
+        """Create an auto mode seller order; with match=False it only rests on the book."""
+        # Expected keys: seller_id, seller_name, energy_amount, min_price, duration, time_window.
+        auto_seller_order = {
+            'seller_id': message['seller_id'],
+            'seller_name': message['seller_name'],
+            'energy_amount': message['energy_amount'],
+            'min_price': message['min_price'],
+            'duration': message['duration'],
+            'time_window': message.get('time_window', None),
+            'window': optional_window_seconds(message.get('time_window')),
+            'conn': self.clients[username]
+        }
+        # Also add to the main sellers dictionary so buyers can see this auto-seller:
+        self.add_seller(message['seller_id'], {
+            'seller_name': message['seller_name'],
+            'energy_type': "AUTO",  # or use a proper energy type if available
+            'energy_amount': message['energy_amount'],
+            'duration': message['duration'],
+            'price': message['min_price'],  # using min_price as the set price
+            'time_window': message.get('time_window', None),
+            'window': auto_seller_order['window'],
+            'timestamp': datetime.now().isoformat(),
+            'conn': self.clients[username]
+        })
+        # Add to the auto mode book, matching against waiting buyers.
+        self.track_order(auto_seller_order['conn'], 'auto_seller', message['seller_id'])
+        if match:
+            self.attempt_auto_match(auto_seller_order)
+        else:
+            self.auto_book.add_seller(auto_seller_order, match=False)
+        return auto_seller_order
+
+    def register_auto_buyer(self, message, username, match=True):
+        """Create an auto mode buyer order; with match=False it only rests on the book."""
+        # Generate a unique buyer ID.
+        buyer_id = str(uuid.uuid4())
+        auto_buyer_order = {
+            'buyer_id': buyer_id,
+            'buyer_name': message['buyer_name'],
+            'needed_energy': message['needed_energy'],
+            'max_price': message['max_price'],
+            'duration': message['duration'],
+            'time_window': message.get('time_window', None),
+            'window': optional_window_seconds(message.get('time_window')),
+            'allow_partial': bool(message.get('allow_partial', False)),
+            'conn': self.clients[username]
+        }
+        # Add the order to the global buyers dictionary, then to the auto mode book.
+        self.buyers[buyer_id] = auto_buyer_order
+        self.track_order(auto_buyer_order['conn'], 'buyer', buyer_id)
+        if match:
+            self.attempt_auto_match(auto_buyer_order)
+        else:
+            self.auto_book.add_buyer(auto_buyer_order, match=False)
+        return auto_buyer_order
+
+    def plan_partial_fill(self, sellers, needed_energy):
+        """
+        Split needed_energy over the given sellers, cheapest first (earliest first on equal
+        price). Returns a list of {'seller_id', 'energy_amount', 'price'} steps; their total
+        is less than needed_energy when the sellers cannot cover it all.
+        """
+        plan = []
+        remaining = needed_energy
+        for seller in sorted(sellers, key=lambda info: info['price']):
+            if remaining <= 0:
+                break
+            energy = min(remaining, seller['energy_amount'])
+            plan.append({'seller_id': seller['seller_id'], 'energy_amount': energy, 'price': seller['price']})
+            remaining -= energy
+        return plan
+
+    def validate_order(self, order):
+        """Return an error message if a batched order is malformed, else None."""
+        if not isinstance(order, dict) or order.get('type') not in BATCH_ORDER_FIELDS:
+            return 'Unsupported order type in batch.'
+        missing = [key for key in BATCH_ORDER_FIELDS[order['type']] if key not in order]
+        if missing:
+            return f"Missing field(s): {', '.join(missing)}."
+        for key in ('energy_amount', 'needed_energy', 'min_price', 'max_price', 'price', 'duration'):
+            if key in order and (not isinstance(order[key], (int, float)) or order[key] < 0):
+                return f"Invalid value for {key}."
+        if order['type'] == 'SELLER_REGISTER' and optional_window_seconds(order['time_window']) is None:
+            return 'Invalid time window format.'
+        return None
+
+    def process_batch(self, orders, username):
+        """
+        Handle many orders from one client in a single pass: validate them all, register the
+        valid ones, match the batch's auto orders in arrival order and persist every resulting
+        mutation in one write.
+        Returns one status dict per order, in order.
+        """
+        results = [None] * len(orders)
+        valid = []
+        for i, order in enumerate(orders):
+            error = self.validate_order(order)
+            if error:
+                results[i] = {'status': 'error', 'message': error}
+            else:
+                valid.append(i)
+        auto_orders = {}
+        with self.deferred_writes():
+            for i in valid:
+                order = orders[i]
+                if order['type'] == 'AUTO_SELLER':
+                    auto_orders[i] = self.register_auto_seller(order, username, match=False)
+                    results[i] = {'status': 'auto_seller_registered', 'seller_id': order['seller_id']}
+                elif order['type'] == 'AUTO_BUYER':
+                    auto_orders[i] = self.register_auto_buyer(order, username, match=False)
+                    results[i] = {'status': 'auto_buyer_registered', 'buyer_id': auto_orders[i]['buyer_id']}
+                else:
+                    results[i] = self.process_message(order, username)
+                    results[i]['seller_id'] = order['seller_id']
+            # Only the batch's own orders are matched, in arrival order, then settled together.
+            self.settle_auto_fills(self.auto_book.match_rested(list(auto_orders.values())))
+        # Report how much of each auto order traded in this batch.
+        for i, auto_order in auto_orders.items():
+            if 'seller_id' in auto_order:
+                results[i]['filled_energy'] = orders[i]['energy_amount'] - auto_order['energy_amount']
+            else:
+                results[i]['filled_energy'] = orders[i]['needed_energy'] - auto_order['needed_energy']
+        print(f"Batch from '{username}': {len(valid)} of {len(orders)} order(s) accepted.")
+        return results
+
+    def day_ahead_loop(self):
+        """Clear the day-ahead auction at gate closure every day."""
+        while True:
+            now = datetime.now()
+            seconds_now = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+            time.sleep((self.gate_closure - seconds_now) % SECONDS_PER_DAY or SECONDS_PER_DAY)
+            try:
+                self.execute(self.clear_day_ahead)
+            except Exception as e:
+                print("Error clearing the day-ahead auction:", e)
+
+    def clear_day_ahead(self):
+        """
+        Gate closure: clear every delivery slot of the day-ahead book at its uniform market
+        clearing price, record a transaction for each filled order and send its owner a
+        DAY_AHEAD_RESULT. Returns one summary dict per slot.
+        """
+        summaries = []
+        with self.deferred_writes():
+            for slot, sides in sorted(self.day_ahead.close().items()):
+                bids, asks = sides['bids'], sides['asks']
+                result = clear_auction(bids['prices'], bids['quantities'], asks['prices'], asks['quantities'])
+                time_window = {'start': format_time_of_day(slot[0]), 'end': format_time_of_day(slot[1])}
+                summaries.append({'time_window': time_window, 'price': result['price'], 'volume': result['volume'],
+                                  'bids': len(bids['ids']), 'asks': len(asks['ids'])})
+                print(f"Day-ahead slot {time_window['start']}-{time_window['end']}: cleared {result['volume']} kWh "
+                      f"at {result['price']} ({len(bids['ids'])} bid(s), {len(asks['ids'])} ask(s)).")
+                for side, orders, fills, role in (('BID', bids, result['bid_fills'], 'Buyer'),
+                                                  ('ASK', asks, result['ask_fills'], 'Seller')):
+                    for i in np.flatnonzero(fills):
+                        self.update_transaction(orders['users'][i], role, float(fills[i]), result['price'])
+                    self.notify_day_ahead(side, orders, fills, result['price'], time_window)
+        return summaries
+
+    def notify_day_ahead(self, side, orders, fills, price, time_window):
+        """Send each connected order owner the outcome of their day-ahead order."""
+        for order_id, username, quantity, filled in zip(orders['ids'], orders['users'], orders['quantities'], fills):
+            conn = self.clients.get(username)
+            if conn is None:
+                continue
+            try:
+                self.notify(conn, {
+                    'type': 'DAY_AHEAD_RESULT',
+                    'order_id': order_id,
+                    'side': side,
+                    'time_window': time_window,
+                    'energy_amount': quantity,
+                    'filled_energy': float(filled),
+                    'price': price if filled > 0 else None
+                })
+            except Exception as e:
+                print(f"Error sending day-ahead result to '{username}':", e)
+
     def is_time_window_match(self, seller_tw, buyer_tw, required_duration):
         """
         Check if the seller's time window fully contains the buyer's time window,
         and that the buyer's window length is at least required_duration (in seconds).
         Both seller_tw and buyer_tw are dictionaries with 'start' and 'end' keys.
         The times are expected in "HH:MM" or "HH:MM:SS" format.
+        Matching paths compare the pre-parsed order['window'] pairs with window_contains() instead.
         """
-        from datetime import datetime
-        dummy_date = datetime(1900, 1, 1)
-        # Parse seller start and end
-        try:
-            seller_start = datetime.strptime(seller_tw['start'], "%H:%M:%S").time()
-        except ValueError:
-            seller_start = datetime.strptime(seller_tw['start'], "%H:%M").time()
-        try:
-            seller_end = datetime.strptime(seller_tw['end'], "%H:%M:%S").time()
-        except ValueError:
-            seller_end = datetime.strptime(seller_tw['end'], "%H:%M").time()
-        seller_start_dt = datetime.combine(dummy_date, seller_start)
-        seller_end_dt = datetime.combine(dummy_date, seller_end)
-        
-        # Parse buyer start and end
-        try:
-            buyer_start = datetime.strptime(buyer_tw['start'], "%H:%M:%S").time()
-        except ValueError:
-            buyer_start = datetime.strptime(buyer_tw['start'], "%H:%M").time()
-        try:
-            buyer_end = datetime.strptime(buyer_tw['end'], "%H:%M:%S").time()
-        except ValueError:
-            buyer_end = datetime.strptime(buyer_tw['end'], "%H:%M").time()
-        buyer_start_dt = datetime.combine(dummy_date, buyer_start)
-        buyer_end_dt = datetime.combine(dummy_date, buyer_end)
-        
-        # Check that buyer's window is completely within seller's window.
-        if buyer_start_dt >= seller_start_dt and buyer_end_dt <= seller_end_dt:
-            # Compute the buyer's window duration in seconds.
-            buyer_window_duration = (buyer_end_dt - buyer_start_dt).total_seconds()
-            if buyer_window_duration >= required_duration:
-                return True
-        return False
+        return window_contains(window_seconds(seller_tw), window_seconds(buyer_tw), required_duration)
 
     def process_message(self, message, username):
         """Process messages other than authentication."""
         if message['type'] == 'AUTO_SELLER':
-            # Expected keys: seller_id, seller_name, energy_amount, min_price, duration, time_window.
-            auto_seller_order = {
-                'seller_id': message['seller_id'],
-                'seller_name': message['seller_name'],
-                'energy_amount': message['energy_amount'],
-                'min_price': message['min_price'],
-                'duration': message['duration'],
-                'time_window': message.get('time_window', None),
-                'conn': self.clients[username]
-            }
-            # Add to the auto seller list
-            self.auto_sellers.append(auto_seller_order)
-            # Also add to the main sellers dictionary so buyers can see this auto-seller:
-            self.sellers[message['seller_id']] = {
-                'seller_name': message['seller_name'],
-                'energy_type': "AUTO",  # or use a proper energy type if available
-                'energy_amount': message['energy_amount'],
-                'duration': message['duration'],
-                'price': message['min_price'],  # using min_price as the set price
-                'time_window': message.get('time_window', None),
-                'timestamp': datetime.now().isoformat(),
-                'conn': self.clients[username]
-            }
-            self.attempt_auto_match()
+            self.register_auto_seller(message, username)
             return {'status': 'auto_seller_registered'}
 
 
         elif message['type'] == 'AUTO_BUYER':
-            # Generate a unique buyer ID.
-            buyer_id = str(uuid.uuid4())
-            auto_buyer_order = {
-                'buyer_id': buyer_id,
-                'buyer_name': message['buyer_name'],
-                'needed_energy': message['needed_energy'],
-                'max_price': message['max_price'],
-                'duration': message['duration'],
-                'time_window': message.get('time_window', None),
-                'conn': self.clients[username]
-            }
-            # Add the order to the auto_buyers list.
-            self.auto_buyers.append(auto_buyer_order)
-            # Also add the order to the global buyers dictionary.
-            self.buyers[buyer_id] = auto_buyer_order
-            self.attempt_auto_match()
+            self.register_auto_buyer(message, username)
             return {'status': 'auto_buyer_registered'}
 
 
+        elif message['type'] == 'BATCH':
+            # Expected key: orders (a list of AUTO_SELLER, AUTO_BUYER and SELLER_REGISTER messages).
+            orders = message.get('orders')
+            if not isinstance(orders, list):
+                return {'status': 'error', 'message': 'BATCH requires a list of orders.'}
+            return {'status': 'batch_processed', 'results': self.process_batch(orders, username)}
+
+        elif message['type'] in ('DAY_AHEAD_BID', 'DAY_AHEAD_ASK'):
+            # Expected keys: energy_amount, price, time_window (the delivery slot).
+            window = optional_window_seconds(message.get('time_window'))
+            if window is None or window[0] >= window[1]:
+                return {'status': 'error', 'message': 'Invalid time window format.'}
+            for key in ('energy_amount', 'price'):
+                if not isinstance(message.get(key), (int, float)) or message[key] <= 0:
+                    return {'status': 'error', 'message': f'Invalid value for {key}.'}
+            order_id = str(uuid.uuid4())
+            side = 'bids' if message['type'] == 'DAY_AHEAD_BID' else 'asks'
+            self.day_ahead.add(side, window, order_id, username, message['price'], message['energy_amount'])
+            print(f"Day-ahead {side[:-1]} from '{username}': {message['energy_amount']} kWh at {message['price']}.")
+            return {'status': 'day_ahead_order_accepted', 'order_id': order_id}
+
+        elif message['type'] == 'PROFILE':
+            # Admin only: {'action': 'start', 'messages': N, 'seconds': S} or {'action': 'stop'}.
+            if username not in self.admin_users:
+                return {'status': 'error', 'message': 'Not authorised.'}
+            if message.get('action', 'start') == 'stop':
+                return {'status': 'profiling_stopped', 'files': self.profiler.stop()}
+            self.profiler.start(message.get('messages'), message.get('seconds'))
+            return {'status': 'profiling_started'}
+
+        elif message['type'] == 'SUBSCRIBE':
+            # Expected keys: time_window; optional: min_energy, duration (seconds).
+            window = optional_window_seconds(message.get('time_window'))
+            if window is None:
+                return {'status': 'error', 'message': 'Invalid time window format.'}
+            count = self.subscribe(self.clients[username], window,
+                                   message.get('min_energy', 0), message.get('duration', 0))
+            print(f"'{username}' subscribed to the order book ({count} matching seller(s)).")
+            return {'status': 'subscribed', 'sellers': count}
+
+        elif message['type'] == 'UNSUBSCRIBE':
+            self.subscriptions.pop(self.clients[username], None)
+            return {'status': 'unsubscribed'}
+
         elif message['type'] == 'SELLER_REGISTER':
             # Expected keys: seller_id, seller_name, energy_type, energy_amount, duration, price, time_window.
             seller_id = message['seller_id']
@@ -419,14 +1317,11 @@ class Server:
                 return {'status': 'error', 'message': 'Time window must include both start and end times.'}
             # Enforce that the trading window is for the day-ahead market.
             try:
+                # Parse the window once into seconds since midnight; matching uses these integers.
+                window = window_seconds(tw)
                 # Assume that the provided time strings (HH:MM or HH:MM:SS) are for the next day.
                 tomorrow = datetime.now() + timedelta(days=1)
-                # Parse the start time:
-                try:
-                    start_time_obj = datetime.strptime(tw['start'], "%H:%M:%S").time()
-                except ValueError:
-                    start_time_obj = datetime.strptime(tw['start'], "%H:%M").time()
-                start_datetime = datetime.combine(tomorrow.date(), start_time_obj)
+                start_datetime = datetime.combine(tomorrow.date(), datetime.min.time()) + timedelta(seconds=window[0])
                 # Require that the trading window start is at least 12 hours ahead.
                 '''if start_datetime < datetime.now() + timedelta(hours=12):
                     return {'status': 'error', 'message': 'Trading window start must be at least 12 hours ahead.'}'''
@@ -439,16 +1334,18 @@ class Server:
             duration = message['duration']
             price = message['price']
             # Save the time window as provided.
-            self.sellers[seller_id] = {
+            self.add_seller(seller_id, {
                 'seller_name': seller_name,
                 'energy_type': energy_type,
                 'energy_amount': energy_amount,
                 'duration': duration,
                 'price': price,
                 'time_window': tw,  # Store the provided window.
+                'window': window,
+                'capacity': SlotCapacity(window, energy_amount),   # Offer spread over 15-minute slots.
                 'timestamp': datetime.now().isoformat(),
                 'conn': self.clients[username]
-            }
+            })
             self.update_user_info(username, 'Seller', energy_amount, price)
             print(f"Seller registered: {seller_name} (ID: {seller_id}), Time Window: {tw}")
             return {'status': 'seller_registered'}
@@ -459,7 +1356,19 @@ class Server:
             field = message['field']
             value = message['value']
             if seller_id in self.sellers:
+                old_window = self.sellers[seller_id].get('window')
                 self.sellers[seller_id][field] = value
+                capacity = self.sellers[seller_id].get('capacity')
+                if field == 'time_window':
+                    self.sellers[seller_id]['window'] = optional_window_seconds(value)
+                    self.index_seller_window(seller_id)
+                    if capacity is not None and self.sellers[seller_id]['window'] is not None:
+                        capacity.set_offer(self.sellers[seller_id]['window'], capacity.energy_amount)
+                        self.sellers[seller_id]['energy_amount'] = capacity.remaining()
+                elif field == 'energy_amount' and capacity is not None:
+                    capacity.set_offer(capacity.window, value)
+                    self.sellers[seller_id]['energy_amount'] = capacity.remaining()
+                self.seller_changed(seller_id, old_window)
                 print(f"Seller {seller_id} updated {field} to {value}.")
                 return {'status': 'updated', 'message': f'{field} updated successfully.'}
             else:
@@ -470,7 +1379,7 @@ class Server:
             seller_id = message['seller_id']
             if seller_id in self.sellers:
                 seller_name = self.sellers[seller_id]['seller_name']
-                del self.sellers[seller_id]
+                self.remove_seller(seller_id)
                 self.remove_user_info(username)
                 print(f"Seller {seller_name} (ID: {seller_id}) removed.")
                 return {'status': 'removed', 'message': 'Seller removed successfully.'}
@@ -485,12 +1394,9 @@ class Server:
             if 'start' not in tw or 'end' not in tw:
                 return {'status': 'error', 'message': 'Time window must include both start and end times.'}
             try:
+                window = window_seconds(tw)
                 tomorrow = datetime.now() + timedelta(days=1)
-                try:
-                    start_time_obj = datetime.strptime(tw['start'], "%H:%M:%S").time()
-                except ValueError:
-                    start_time_obj = datetime.strptime(tw['start'], "%H:%M").time()
-                start_datetime = datetime.combine(tomorrow.date(), start_time_obj)
+                start_datetime = datetime.combine(tomorrow.date(), datetime.min.time()) + timedelta(seconds=window[0])
                 """if start_datetime < datetime.now() + timedelta(hours=12):
                     return {'status': 'error', 'message': 'Trading window start must be at least 12 hours ahead.'}"""
             except Exception as e:
@@ -498,27 +1404,29 @@ class Server:
             
             needed_energy = message['needed_energy']
             duration = message['duration']
-            # Instead of checking a transaction date, we use the provided time_window.
-            available_sellers = []
-            for sid, info in self.sellers.items():
-                # (Optionally, you can add a check that the seller's time window
-                # matches or overlaps with the buyer's time window.)
-                seller_tw = info.get('time_window', {})
-                if info['energy_amount'] >= needed_energy:
-                    # For example, you might check that the seller's start time equals the buyer's start time.
-                    #if seller_tw.get('start') == tw.get('start'):
-                    if info['energy_amount'] >= needed_energy and self.is_time_window_match(seller_tw, tw, duration):
-                        seller_info = {
-                            'seller_id': sid,
-                            'seller_name': info['seller_name'],
-                            'energy_type': info['energy_type'],
-                            'energy_amount': info['energy_amount'],
-                            'duration': info['duration'],
-                            'price': info['price'],
-                            'time_window': seller_tw
-                        }
-                        available_sellers.append(seller_info)
+            # With allow_partial, sellers that only cover part of the request are listed too.
+            allow_partial = bool(message.get('allow_partial', False))
+            # Popular requests are answered from the cache until a relevant seller changes.
+            cache_key = (window, float(needed_energy), duration, allow_partial)
+            available_sellers = self.request_cache.get(cache_key)
+            if available_sellers is None:
+                start = time.perf_counter()
+                # Instead of checking a transaction date, we use the provided time_window.
+                # The window index returns only sellers whose window contains the buyer's.
+                available_sellers = []
+                # The buyer's window must also be long enough for the requested duration.
+                if window[1] - window[0] >= duration:
+                    for sid in self.seller_windows.query(window[0], window[1]):
+                        # What the seller has left over the buyer's slots, after earlier reservations.
+                        energy_amount = self.available_energy(sid, window)
+                        if energy_amount + EPSILON >= needed_energy or (allow_partial and energy_amount > 0):
+                            available_sellers.append(self.seller_view(sid, energy_amount))
+                self.request_cache.put(cache_key, available_sellers)
+                self.record_stage('match', time.perf_counter() - start)
             print(f"Buyer request from '{message.get('buyer_name', username)}' for {needed_energy} kWh; {len(available_sellers)} seller(s) available with matching time window.")
+            if allow_partial:
+                return {'available_sellers': available_sellers,
+                        'fill_plan': self.plan_partial_fill(available_sellers, needed_energy)}
             return {'available_sellers': available_sellers}
 
         elif message['type'] == 'TRANSACTION':
@@ -529,15 +1437,18 @@ class Server:
             duration = message['duration']
             price = message['price']
             tw = message.get('time_window')
-            # Optionally, verify that the time window in the transaction matches the seller's.
-            if seller_id in self.sellers and self.sellers[seller_id]['energy_amount'] >= energy_amount:
-                seller_tw = self.sellers[seller_id].get('time_window', {})
-                buyer_tw = message.get('time_window', {})
-                # For example, require that the seller and buyer have the same trading window start time.
-                '''if buyer_tw.get('start') != seller_tw.get('start'):
-                    return {'status': 'transaction_failed', 'message': 'Trading time window mismatch.'}'''
-                if self.is_time_window_match(seller_tw, tw, duration):
-                    self.sellers[seller_id]['energy_amount'] -= energy_amount
+            buyer_window = optional_window_seconds(tw)
+            # With allow_partial, take whatever the seller has left (up to energy_amount).
+            if message.get('allow_partial') and seller_id in self.sellers:
+                energy_amount = min(energy_amount, self.available_energy(seller_id, buyer_window))
+                if energy_amount <= 0:
+                    return {'status': 'transaction_failed', 'message': 'Seller not found or insufficient energy.'}
+            # The seller must have the energy over the buyer's window, and its window contain it.
+            if seller_id in self.sellers and self.available_energy(seller_id, buyer_window) + EPSILON >= energy_amount:
+                seller_window = self.sellers[seller_id].get('window')
+                if seller_window and buyer_window and window_contains(seller_window, buyer_window, duration):
+                    # Only the slots of the buyer's window are used up; the rest stay available.
+                    self.reserve_energy(seller_id, buyer_window, energy_amount)
                     # Update the transaction history for both buyer and seller.
                     self.update_transaction(buyer_name,
                                             f"Bought {energy_amount} kWh from seller {self.sellers[seller_id]['seller_name']}.",
@@ -559,15 +1470,17 @@ class Server:
                     try:
                         seller_conn = self.sellers[seller_id].get('conn')
                         if seller_conn:
-                            seller_conn.sendall(json.dumps(notification).encode())
+                            self.notify(seller_conn, notification)
                     except Exception as e:
                         print("Error sending transaction notification to seller:", e)
                     try:
                         buyer_conn = self.clients[username]
                         if buyer_conn:
-                            buyer_conn.sendall(json.dumps(notification).encode())
+                            self.notify(buyer_conn, notification)
                     except Exception as e:
                         print("Error sending transaction notification to buyer:", e)
+                    if message.get('allow_partial'):
+                        return {'status': 'transaction_success', 'energy_amount': energy_amount}
                     return {'status': 'transaction_success'}
                 else:
                     return {'status': 'transaction_failed', 'message': 'Seller not found or insufficient energy.'}
@@ -576,15 +1489,102 @@ class Server:
                 return {'status': 'unknown_command', 'message': 'Command not recognized.'}
 
 
-    def start(self):
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-                server_socket.bind((self.host, self.port))
-                server_socket.listen()
-                print(f"Server started on {self.host}:{self.port}")
-                while True:
-                    conn, addr = server_socket.accept()
-                    threading.Thread(target=self.handle_client, args=(conn, addr), daemon=True).start()
+    def start(self, mode='threaded'):
+        """
+        Serve clients. 'threaded' runs one reader thread per connection, with a single
+        thread writing to all of them; 'asyncio' runs every connection as a task on a
+        single event loop, which keeps thousands of idle connections cheap.
+        """
+        if mode == 'asyncio':
+            asyncio.run(self.serve_async())
+            return
+        if self.connection_writer is None:
+            self.connection_writer = ConnectionWriter()
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+            server_socket.bind((self.host, self.port))
+            server_socket.listen()
+            print(f"Server started on {self.host}:{self.port}")
+            while True:
+                conn, addr = server_socket.accept()
+                threading.Thread(target=self.handle_client, args=(conn, addr), daemon=True).start()
+
+    async def serve_async(self):
+        raise_open_file_limit()
+        server = await asyncio.start_server(self.handle_client_async, self.host, self.port, backlog=4096)
+        print(f"Server started on {self.host}:{self.port} (asyncio)")
+        async with server:
+            await server.serve_forever()
+
+
+def wait_tickets(tickets):
+    """Wait for every group commit ticket (raises the first write error)."""
+    for ticket in tickets:
+        ticket.wait()
+
+
+def format_time_of_day(seconds):
+    """Format seconds since midnight as "HH:MM:SS"."""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def raise_open_file_limit():
+    """Raise the soft open-file limit to the hard limit; each connection holds a descriptor."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
 
 if __name__ == "__main__":
-    server = Server()
-    server.start()
+    parser = argparse.ArgumentParser(description="P2P energy trading server")
+    parser.add_argument('--host', default='192.168.166.7')
+    parser.add_argument('--port', type=int, default=65432)
+    parser.add_argument('--mode', choices=['threaded', 'asyncio'], default='threaded')
+    parser.add_argument('--storage', choices=['excel', 'sqlite'], default='excel')
+    parser.add_argument('--durability', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--commit-window', type=float, default=0.0,
+                        help="Seconds to wait for more mutations before each group commit")
+    parser.add_argument('--gate-closure', default='12:00',
+                        help="Daily day-ahead auction gate closure (HH:MM)")
+    parser.add_argument('--outbound-high-water', type=int, default=HIGH_WATER,
+                        help="Queued outbound bytes after which a stalled client is disconnected")
+    parser.add_argument('--request-cache-size', type=int, default=1024,
+                        help="Number of BUYER_REQUEST results to cache (0 disables the cache)")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--admin', nargs='*', default=[],
+                        help="Users allowed to send admin messages (PROFILE)")
+    parser.add_argument('--profile-dir', default='profiles',
+                        help="Where profiles are written; SIGUSR1 profiles the next 1000 messages")
+    parser.add_argument('--slow-request-ms', type=float, default=None,
+                        help="Log requests taking at least this long, with their stage timings")
+    parser.add_argument('--slow-request-log', default=None,
+                        help="Append slow requests as JSON lines to this file (default: print them)")
+    parser.add_argument('--record', default=None,
+                        help="Record inbound messages to this gzip file (replay with benchmarks/replay.py)")
+    parser.add_argument('--snapshot', default=None,
+                        help="Order book snapshot file, restored on startup and rewritten periodically")
+    parser.add_argument('--snapshot-interval', type=float, default=30,
+                        help="Seconds between order book snapshots")
+    args = parser.parse_args()
+    server = Server(host=args.host, port=args.port, storage=args.storage,
+                    durability=args.durability, commit_window=args.commit_window,
+                    gate_closure=args.gate_closure, outbound_high_water=args.outbound_high_water,
+                    request_cache_size=args.request_cache_size, metrics_port=args.metrics_port,
+                    admin_users=args.admin, profile_dir=args.profile_dir,
+                    slow_request_threshold=args.slow_request_ms / 1000 if args.slow_request_ms is not None else None,
+                    slow_request_log=args.slow_request_log, record_traffic=args.record,
+                    snapshot_file=args.snapshot, snapshot_interval=args.snapshot_interval)
+    # Turn SIGTERM into a normal exit so shutdown() flushes pending writes.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # SIGUSR1 toggles profiling of the live server (where the platform has it).
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: server.profiler.stop() if server.profiler.active
+                      else server.profiler.start())
+    try:
+        server.start(mode=args.mode)
+    finally:
+        server.shutdown()
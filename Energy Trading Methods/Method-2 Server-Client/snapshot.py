@@ -0,0 +1,38 @@
+import os
+import pickle
+
+# Bumped whenever the snapshot layout changes; snapshots of another version are ignored.
+SNAPSHOT_VERSION = 1
+
+
+def write_snapshot(path, data):
+    """
+    Replace the snapshot file with data (pickled bytes). The data is written and fsynced to
+    a temporary file which is then swapped in, so a crash never leaves a half-written snapshot.
+    """
+    root, ext = os.path.splitext(path)
+    tmp_file = root + '.tmp' + ext
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def read_snapshot(path):
+    """
+    Load a snapshot written by write_snapshot; returns None if there is none, it cannot be
+    read or it has another version. Snapshots are pickles: only load files this server wrote.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable order book snapshot {path}: {e}")
+        return None
+    if not isinstance(state, dict) or state.get('version') != SNAPSHOT_VERSION:
+        print(f"Ignoring order book snapshot {path} with an unsupported version.")
+        return None
+    return state
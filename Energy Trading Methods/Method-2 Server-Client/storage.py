@@ -0,0 +1,351 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+from journal import Journal
+
+# Extra workbook sheet recording which journal records the workbook already contains.
+JOURNAL_SHEET = 'Journal'
+
+# Summary sheet (Sheet1) columns and their SQLite column names.
+USER_COLUMNS = {
+    'Username': 'username',
+    'Password': 'password',
+    'Registration Time': 'registration_time',
+    'Seller/Buyer': 'role',
+    'Energy Quantity (kWh)': 'energy_quantity',
+    'Price per Unit': 'price_per_unit',
+    'Last Transaction Time': 'last_transaction_time',
+    'Amount of Duration': 'amount_of_duration',
+    'Date': 'date'
+}
+# Per-user transaction sheet columns and their SQLite column names.
+TRANSACTION_COLUMNS = {
+    'Transaction Time': 'transaction_time',
+    'Seller/Buyer': 'role',
+    'Energy Quantity (kWh)': 'energy_quantity',
+    'Price per Unit': 'price_per_unit',
+    'Amount of Duration': 'amount_of_duration',
+    'Date': 'date'
+}
+
+
+def write_workbook(path, database, transactions, user_to_sheet, extra_sheets=None):
+    """
+    Write the summary and per-user transaction sheets to an Excel file.
+    The workbook is written to a temporary file and swapped in, so readers never see a half-written file.
+    """
+    root, ext = os.path.splitext(path)
+    tmp_file = root + '.tmp' + ext
+    with pd.ExcelWriter(tmp_file) as writer:
+        database.to_excel(writer, sheet_name='Sheet1', index=False)
+        for user, sheet_name in user_to_sheet.items():
+            transactions[user].to_excel(writer, sheet_name=sheet_name, index=False)
+        for sheet_name, df in (extra_sheets or {}).items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    os.replace(tmp_file, path)
+
+
+class ExcelStorage:
+    """
+    Excel workbook plus append-only journal.
+    Mutations are appended to the journal in O(1); checkpoint() folds them into the workbook.
+    """
+    def __init__(self, db_file='excell.xlsx', journal_file=None, fsync=True):
+        self.db_file = db_file
+        self.journal = Journal(journal_file or db_file + '.journal', fsync=fsync)
+
+    @property
+    def pending(self):
+        return self.journal.pending
+
+    def load(self, user_to_sheet):
+        """
+        Return (database, transactions, records). database is None when the workbook is missing
+        or unreadable; records are the journal mutations the workbook does not contain yet.
+        """
+        records = self.journal.replay()
+        compacted_seq = 0
+        database, transactions = None, None
+        if os.path.exists(self.db_file):
+            try:
+                sheets = pd.read_excel(self.db_file, sheet_name=None)
+                database = sheets.get('Sheet1', pd.DataFrame(columns=[
+                    'Username', 'Password', 'Registration Time', 'Seller/Buyer',
+                    'Energy Quantity (kWh)', 'Price per Unit', 'Last Transaction Time'
+                ]))
+                # For each user defined in our mapping, load (or create) a transaction sheet.
+                transactions = {}
+                for user, sheet_name in user_to_sheet.items():
+                    if sheet_name in sheets:
+                        transactions[user] = sheets[sheet_name]
+                    else:
+                        transactions[user] = pd.DataFrame(columns=[
+                            'Transaction Time', 'Seller/Buyer', 'Energy Quantity (kWh)', 'Price per Unit'
+                        ])
+                # The last journal sequence number folded into this workbook.
+                if JOURNAL_SHEET in sheets and not sheets[JOURNAL_SHEET].empty:
+                    compacted_seq = int(sheets[JOURNAL_SHEET]['Last Sequence'].iloc[0])
+                    self.journal.seq = max(self.journal.seq, compacted_seq)
+            except Exception as e:
+                print("Error loading Excel file:", e)
+                database, transactions = None, None
+        records = [record for record in records if record['seq'] > compacted_seq]
+        return database, transactions, records
+
+    def write(self, mutations):
+        self.journal.append(mutations)
+
+    def begin_checkpoint(self):
+        """
+        Called while the state being checkpointed is captured: rotates the journal, so records
+        written from now on are kept. Returns the mark to pass to checkpoint().
+        """
+        return self.journal.rotate()
+
+    def checkpoint(self, database, transactions, user_to_sheet, mark):
+        """
+        Save the workbook, then drop the journal records up to mark (the rotated ones). The
+        workbook records the last journal sequence it contains so a crash between the two
+        steps cannot replay a mutation twice.
+        """
+        write_workbook(self.db_file, database, transactions, user_to_sheet, extra_sheets={
+            JOURNAL_SHEET: pd.DataFrame({'Last Sequence': [mark]})
+        })
+        self.journal.discard_rotated()
+
+    def close(self):
+        self.journal.close()
+
+
+class SQLiteStorage:
+    """
+    SQLite database with indexed users and transactions tables.
+    Each write is a single short transaction of cached (prepared) statements, so the cost of
+    persisting a trade does not depend on how many users or past transactions exist.
+    The Excel workbook is only produced as an optional export on checkpoint().
+    """
+    def __init__(self, path='energy.db', export_file=None, import_file='excell.xlsx'):
+        self.path = path
+        self.export_file = export_file
+        self.import_file = import_file
+        self.lock = threading.Lock()
+        self.pending = 0    # Mutations written since the last Excel export.
+        self.conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                password TEXT,
+                registration_time TEXT,
+                role TEXT,
+                energy_quantity REAL,
+                price_per_unit REAL,
+                last_transaction_time TEXT,
+                amount_of_duration REAL,
+                date TEXT
+            );
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                transaction_time TEXT,
+                role TEXT,
+                energy_quantity REAL,
+                price_per_unit REAL,
+                amount_of_duration REAL,
+                date TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_transactions_username ON transactions (username, id);
+        """)
+        self.conn.commit()
+        # Statement text is fixed per column so sqlite3's statement cache reuses the compiled plan.
+        self.update_sql = {
+            col: f"UPDATE users SET {sql_col} = ? WHERE username = ?"
+            for col, sql_col in USER_COLUMNS.items() if col != 'Username'
+        }
+        self.insert_user_sql = "INSERT OR REPLACE INTO users ({}) VALUES ({})".format(
+            ', '.join(USER_COLUMNS.values()), ', '.join('?' * len(USER_COLUMNS)))
+        self.insert_new_user_sql = "INSERT OR IGNORE INTO users ({}) VALUES ({})".format(
+            ', '.join(USER_COLUMNS.values()), ', '.join('?' * len(USER_COLUMNS)))
+        self.insert_transaction_sql = "INSERT INTO transactions (username, {}) VALUES (?, {})".format(
+            ', '.join(TRANSACTION_COLUMNS.values()), ', '.join('?' * len(TRANSACTION_COLUMNS)))
+
+    def load(self, user_to_sheet):
+        """Return (database, transactions, records); the first run imports the existing Excel workbook."""
+        with self.lock:
+            empty = self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+        if empty and self.import_file and os.path.exists(self.import_file):
+            self.import_workbook(user_to_sheet)
+        with self.lock:
+            database = pd.read_sql_query(
+                "SELECT {} FROM users ORDER BY rowid".format(', '.join(USER_COLUMNS.values())), self.conn)
+            database.columns = list(USER_COLUMNS)
+            rows = pd.read_sql_query(
+                "SELECT username, {} FROM transactions ORDER BY id".format(
+                    ', '.join(TRANSACTION_COLUMNS.values())), self.conn)
+        rows.columns = ['Username'] + list(TRANSACTION_COLUMNS)
+        transactions = {}
+        for user, df in rows.groupby('Username', sort=False):
+            transactions[user] = df.drop(columns='Username').reset_index(drop=True)
+        for user in user_to_sheet:
+            if user not in transactions:
+                transactions[user] = pd.DataFrame(columns=list(TRANSACTION_COLUMNS))
+        return database, transactions, []
+
+    def import_workbook(self, user_to_sheet):
+        """Copy the summary and transaction sheets of the Excel workbook into the database."""
+        sheets = pd.read_excel(self.import_file, sheet_name=None)
+        summary = sheets.get('Sheet1', pd.DataFrame(columns=list(USER_COLUMNS)))
+        user_rows = []
+        for row in summary.to_dict('records'):
+            values = [to_sql_value(row.get(col)) for col in USER_COLUMNS]
+            # Passwords are compared as strings anyway; store them that way.
+            if values[1] is not None:
+                values[1] = str(values[1])
+            user_rows.append(tuple(values))
+        transaction_rows = []
+        for user, sheet_name in user_to_sheet.items():
+            if sheet_name in sheets:
+                for row in sheets[sheet_name].to_dict('records'):
+                    transaction_rows.append(
+                        (user,) + tuple(to_sql_value(row.get(col)) for col in TRANSACTION_COLUMNS))
+        with self.lock, self.conn:
+            self.conn.executemany(self.insert_user_sql, user_rows)
+            self.conn.executemany(self.insert_transaction_sql, transaction_rows)
+        print(f"Imported {len(user_rows)} user(s) and {len(transaction_rows)} transaction(s) from {self.import_file}.")
+
+    def write(self, mutations):
+        """Persist a group of mutations in one SQLite transaction."""
+        with self.lock, self.conn:
+            for mutation in mutations:
+                username = mutation['username']
+                if mutation['op'] == 'new_user':
+                    fields = dict(mutation['fields'], Username=username)
+                    self.conn.execute(self.insert_new_user_sql, tuple(
+                        to_sql_value(fields.get(col)) for col in USER_COLUMNS))
+                elif mutation['op'] == 'user':
+                    for col, value in mutation['fields'].items():
+                        if col in self.update_sql:
+                            self.conn.execute(self.update_sql[col], (to_sql_value(value), username))
+                elif mutation['op'] == 'transaction':
+                    record = mutation['record']
+                    self.conn.execute(self.insert_transaction_sql, (username,) + tuple(
+                        to_sql_value(record.get(col)) for col in TRANSACTION_COLUMNS))
+            self.pending += len(mutations)
+
+    def begin_checkpoint(self):
+        """Returns the mark to pass to checkpoint(): the mutations written so far."""
+        with self.lock:
+            return self.pending
+
+    def checkpoint(self, database, transactions, user_to_sheet, mark):
+        """Export the Excel workbook if an export file was configured."""
+        if self.export_file:
+            write_workbook(self.export_file, database, transactions, user_to_sheet)
+        with self.lock:
+            self.pending -= mark
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CommitTicket:
+    """Handed back by GroupCommitWriter.submit(); wait() returns once the mutations are written."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+
+
+class GroupCommitWriter:
+    """
+    Background thread that writes mutations to a storage backend.
+    The first submission opens a commit window of `window` seconds; everything submitted
+    before it closes is written with a single storage.write() (one journal append/fsync or
+    one SQLite transaction). With window=0 the writer takes whatever is queued at that
+    moment, so mutations arriving during a write are grouped into the next one. The queue is
+    bounded, so producers block rather than let unwritten mutations pile up without limit.
+    """
+    def __init__(self, storage, window=0.0, max_queue=10000, on_write=None):
+        self.storage = storage
+        self.window = window
+        self.on_write = on_write
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, mutations):
+        if self.closed:
+            raise RuntimeError("Persistence writer is closed")
+        ticket = CommitTicket()
+        self.queue.put((mutations, ticket))
+        return ticket
+
+    def flush(self):
+        """Block until everything submitted so far has been written."""
+        self.submit([]).wait()
+
+    def close(self):
+        """Write everything still queued, then stop the thread."""
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)    # Stop after this batch.
+                    break
+                batch.append(item)
+            mutations = [mutation for group, _ in batch for mutation in group]
+            error = None
+            try:
+                self.storage.write(mutations)
+            except Exception as e:
+                print("Error writing mutations to storage:", e)
+                error = e
+            for _, ticket in batch:
+                ticket.error = error
+                ticket.done.set()
+            if self.on_write:
+                self.on_write()
+
+
+def to_sql_value(value):
+    """Convert a pandas/numpy cell value to something sqlite3 can bind (NaN/NaT become NULL)."""
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
@@ -0,0 +1,119 @@
+import bisect
+import itertools
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+def parse_time_of_day(value):
+    """Convert "HH:MM" or "HH:MM:SS" to seconds since midnight; raises ValueError otherwise."""
+    parts = value.split(':')
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Invalid time of day: {value!r}")
+    hours, minutes = int(parts[0]), int(parts[1])
+    seconds = int(parts[2]) if len(parts) == 3 else 0
+    if not (0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60):
+        raise ValueError(f"Invalid time of day: {value!r}")
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def window_seconds(tw):
+    """
+    Normalise a {'start': ..., 'end': ...} time window to a (start, end) pair of seconds since
+    midnight. Done once when an order arrives so matching only compares integers.
+    Raises ValueError (or KeyError/TypeError for a malformed dict) if it cannot be parsed.
+    """
+    return parse_time_of_day(tw['start']), parse_time_of_day(tw['end'])
+
+
+def optional_window_seconds(tw):
+    """Like window_seconds, but returns None for a missing or unparseable window."""
+    try:
+        return window_seconds(tw)
+    except (TypeError, KeyError, ValueError, AttributeError):
+        return None
+
+
+def window_contains(outer, inner, required_duration=0):
+    """
+    True if the outer (start, end) window fully contains the inner one and the inner window
+    lasts at least required_duration seconds.
+    """
+    return (inner[0] >= outer[0] and inner[1] <= outer[1]
+            and inner[1] - inner[0] >= required_duration)
+
+
+class WindowIndex:
+    """
+    Index of seller time windows answering "which windows contain [start, end]?".
+    A window contains the query when window_start <= start and window_end >= end, so this is a
+    segment tree over the window start second (0..86399) where each node keeps the largest
+    window end below it. A query walks only the nodes left of `start` whose max end reaches
+    `end`, i.e. O(log n + k log n) for k results instead of checking every seller.
+    Windows sharing a start second (the usual case with HH:MM windows) sit in one leaf kept
+    sorted by end, so the leaf's max end is its last entry and a query only reads the entries
+    from the first end that reaches `end`.
+    """
+    def __init__(self):
+        self.size = 1
+        while self.size < SECONDS_PER_DAY:
+            self.size *= 2
+        self.max_end = [-1] * (2 * self.size)
+        self.leaves = {}        # start -> sorted list of (end, seq, key)
+        self.entries = {}       # key -> (start, end, seq)
+        self.seq = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def add(self, key, start, end):
+        """Insert or move the window for key."""
+        self.remove(key)
+        seq = next(self.seq)
+        self.entries[key] = (start, end, seq)
+        bisect.insort(self.leaves.setdefault(start, []), (end, seq, key))
+        self.update(start)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        start, end, seq = entry
+        leaf = self.leaves[start]
+        # seq is unique, so the search never has to compare keys.
+        del leaf[bisect.bisect_left(leaf, (end, seq))]
+        if not leaf:
+            del self.leaves[start]
+        self.update(start)
+
+    def update(self, start):
+        """Recompute the max end of the leaf for start and of its ancestors."""
+        leaf = self.leaves.get(start)
+        node = start + self.size
+        self.max_end[node] = leaf[-1][0] if leaf else -1
+        node //= 2
+        while node:
+            self.max_end[node] = max(self.max_end[2 * node], self.max_end[2 * node + 1])
+            node //= 2
+
+    def query(self, start, end):
+        """Return the keys whose window contains [start, end], in insertion order."""
+        if not 0 <= start < self.size:
+            return []
+        found = []
+        stack = [(1, 0, self.size - 1)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo > start or self.max_end[node] < end:
+                continue
+            if lo == hi:
+                leaf = self.leaves[lo]
+                found.extend(leaf[bisect.bisect_left(leaf, (end,)):])
+                continue
+            mid = (lo + hi) // 2
+            stack.append((2 * node, lo, mid))
+            stack.append((2 * node + 1, mid + 1, hi))
+        found.sort(key=lambda entry: entry[1])
+        return [key for _, _, key in found]